@@ -0,0 +1,210 @@
+import asyncio
+from collections import deque
+from time import perf_counter
+
+
+class CommandStats:
+    """Latency statistics of one command kind"""
+
+    """Constants"""
+    WINDOW = 200  # latencies kept for percentiles
+
+    def __init__(self):
+        self.sent = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.retries = 0
+        self.latencies = deque(maxlen=self.WINDOW)
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        if latencies:
+            mean = sum(latencies) / len(latencies)
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            worst = latencies[-1]
+        else:
+            mean = p95 = worst = None
+        return {"sent": self.sent, "succeeded": self.succeeded, "failed": self.failed, "retries": self.retries,
+                "mean": mean, "p95": p95, "max": worst}
+
+
+class _ResponseProtocol(asyncio.DatagramProtocol):
+    def __init__(self, client):
+        self.client = client
+
+    def datagram_received(self, data, address):
+        self.client.on_response(data)
+
+    def error_received(self, exc):
+        self.client.on_error(exc)
+
+
+class AsyncUDPClient:
+    """asyncio Tello command client with per-command deadlines, retries with backoff and in-flight tracking.
+    The SDK responses carry no command id, so one command is in flight at a time, responses that come
+    when nothing is in flight are dropped as late ones, and after a timeout the next different command waits
+    out a quarantine so a late "ok" can not be matched to it: LATE_WINDOW after a short command, the whole
+    LONG_TIMEOUT after a movement, which is answered only when the movement ends.
+    A response later than the quarantine can still be taken by the next command of the same response kind,
+    the protocol has nothing to tell them apart. Movements are not retried by default: a lost "ok" after
+    the drone has moved would move it again"""
+
+    """Constants"""
+    TIMEOUT = 1.0  # default response deadline (s)
+    LONG_TIMEOUT = 20.0  # deadline of commands finished after the drone movement
+    LONG_COMMANDS = ("takeoff", "land", "up", "down", "left", "right", "forward", "back", "cw", "ccw", "flip", "go",
+                     "curve")
+    RETRIES = 2  # attempts after the first one, LONG_COMMANDS are not retried by default
+    BACKOFF = 0.1  # pause before the first retry, doubled for every next one
+    LATE_WINDOW = 0.3  # quarantine after a timeout
+
+    def __init__(self, server=("192.168.10.1", 8889), buffer_size=1024):
+        self.server = server
+        self.buffer_size = buffer_size
+        self.transport = None
+        self.lock = None
+        self.inflight = None
+        self.last_timed_out = None
+        self.quarantine_until = 0.0
+
+        """Statistics"""
+        self.stats = {}
+        self.late_responses = 0
+        self.mismatched_responses = 0
+        self.timeouts = 0
+
+    async def connect(self):
+        if self.transport is None:
+            loop = asyncio.get_running_loop()
+            self.transport, _ = await loop.create_datagram_endpoint(lambda: _ResponseProtocol(self),
+                                                                    remote_addr=self.server)
+            self.lock = asyncio.Lock()
+        return self
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *args):
+        self.close()
+
+    """Responses"""
+
+    def on_response(self, data):
+        try:
+            response = data.decode('utf-8').rstrip("\r\n")
+        except UnicodeDecodeError:
+            self.mismatched_responses += 1
+            return
+        if self.inflight is None or self.inflight[1].done():
+            self.late_responses += 1
+            return
+        command, future = self.inflight
+        if not self.matches(command, response):
+            self.mismatched_responses += 1
+            return
+        future.set_result(response)
+
+    def on_error(self, exc):
+        if self.inflight is not None and not self.inflight[1].done():
+            self.inflight[1].set_exception(exc)
+
+    @staticmethod
+    def matches(command, response):
+        """Queries are answered with values, other commands with ok or error"""
+        is_status = response == "ok" or response.startswith("error")
+        if command.endswith("?"):
+            return response != "ok"
+        return is_status
+
+    def is_long(self, command):
+        return command.split(" ", 1)[0] in self.LONG_COMMANDS
+
+    def deadline(self, command):
+        return self.LONG_TIMEOUT if self.is_long(command) else self.TIMEOUT
+
+    def quarantine(self, command):
+        """Seconds a late response to the timed out COMMAND is expected in"""
+        return self.LONG_TIMEOUT if self.is_long(command) else self.LATE_WINDOW
+
+    def command_stats(self, command):
+        name = command.split(" ", 1)[0]
+        if name not in self.stats:
+            self.stats[name] = CommandStats()
+        return self.stats[name]
+
+    """Sending"""
+
+    def send_nowait(self, command):
+        """Sends command without waiting for response (rc commands)"""
+        self.transport.sendto(command.encode('utf-8'))
+
+    async def send_command(self, command, timeout=None, retries=None):
+        """Sends command and waits for its response.
+        Arguments: timeout: response deadline of every attempt,
+        retries: attempts after the first one (RETRIES, 0 for LONG_COMMANDS by default)
+        Returns: response or None if there was no valid response"""
+        await self.connect()
+        timeout = timeout if timeout is not None else self.deadline(command)
+        if retries is None:
+            retries = 0 if self.is_long(command) else self.RETRIES
+        stats = self.command_stats(command)
+        loop = asyncio.get_running_loop()
+        async with self.lock:
+            wait = self.quarantine_until - loop.time()
+            if command != self.last_timed_out and wait > 0:
+                await asyncio.sleep(wait)
+            for attempt in range(retries + 1):
+                if attempt > 0:
+                    stats.retries += 1
+                    await asyncio.sleep(self.BACKOFF * 2 ** (attempt - 1))
+                future = loop.create_future()
+                self.inflight = (command, future)
+                stats.sent += 1
+                start = perf_counter()
+                self.transport.sendto(command.encode('utf-8'))
+                try:
+                    response = await asyncio.wait_for(future, timeout)
+                except asyncio.TimeoutError:
+                    self.timeouts += 1
+                    self.last_timed_out = command
+                    self.quarantine_until = loop.time() + self.quarantine(command)
+                    continue
+                except OSError:
+                    continue
+                finally:
+                    self.inflight = None
+                stats.latencies.append(perf_counter() - start)
+                stats.succeeded += 1
+                self.last_timed_out = None
+                return response
+            stats.failed += 1
+            return None
+
+    def summary(self):
+        """Returns: dict of per-command statistics"""
+        return {name: stats.summary() for name, stats in self.stats.items()}
+
+
+def main():
+    import sys
+
+    async def run():
+        host = sys.argv[1] if len(sys.argv) > 1 else "192.168.10.1"
+        async with AsyncUDPClient((host, 8889)) as client:
+            for command in ["command", "battery?", "speed?"] * 10:
+                print(command, await client.send_command(command))
+            for name, stats in client.summary().items():
+                print(name, stats)
+            print(f"timeouts: {client.timeouts}, late: {client.late_responses}, "
+                  f"mismatched: {client.mismatched_responses}")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
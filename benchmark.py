@@ -0,0 +1,148 @@
+import json
+import sys
+from time import perf_counter
+import numpy as np
+from cv2 import resize, cvtColor, GaussianBlur, ellipse, COLOR_BGR2GRAY
+from face_vector import FaceVector
+from hud import HUD
+
+
+def synthetic_frames(number=30, height=720, width=960, seed=0):
+    """Deterministic frames: smooth noise background with a bright ellipse moving over it"""
+    rng = np.random.default_rng(seed)
+    background = GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (0, 0), 3)
+    frames = []
+    for i in range(number):
+        frame = background.copy()
+        center = (width // 4 + i * width // (2 * number), height // 2)
+        ellipse(frame, center, (width // 16, height // 9), 0, 0, 360, (180, 190, 220), -1)
+        frames.append(frame)
+    return frames
+
+
+def recorded_frames(source, number=100):
+    """First NUMBER frames of a video file, frames directory or .npy stack"""
+    from face_vector_batch import iterate_frames
+    if source.endswith('.npy'):
+        source = np.load(source, mmap_mode='r')
+    frames = []
+    for _, _, frame in iterate_frames(source):
+        frames.append(np.ascontiguousarray(frame))
+        if len(frames) >= number:
+            break
+    return frames
+
+
+def measure(function, inputs, prepare=None, warmup=2, repeat=1):
+    """Returns: latencies (s) of FUNCTION over inputs. PREPARE makes an argument for every call outside the timer"""
+    latencies = []
+    for i in range(warmup):
+        argument = inputs[i % len(inputs)]
+        function(prepare(argument) if prepare is not None else argument)
+    for _ in range(repeat):
+        for item in inputs:
+            argument = prepare(item) if prepare is not None else item
+            start = perf_counter()
+            function(argument)
+            latencies.append(perf_counter() - start)
+    return latencies
+
+
+def summary(latencies):
+    """Returns: dict with p50, p95, p99 latencies (ms) and frames per second"""
+    values = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99),
+            "fps": float(1000 / values.mean()) if values.mean() > 0 else 0.0, "samples": len(latencies)}
+
+
+def run_benchmarks(frames, fv, repeat=1):
+    """Times every stage of the vision hot path. Returns: dict of stage summaries"""
+    resized = [resize(frame, (fv.width, fv.height)) for frame in frames]
+    face = (fv.width // 2 - fv.width // 10, fv.height // 2 - fv.height // 10, fv.width // 5, fv.width // 5)
+    vector = [1, -1, 0]
+    hud = HUD(fv)
+    benchmarks = {
+        "resize": (lambda image: resize(image, (fv.width, fv.height)), frames, None),
+        "cvtColor": (lambda image: cvtColor(image, COLOR_BGR2GRAY), resized, None),
+        "face_detection": (fv.face_detection, resized, None),
+        "frame_processing": (fv.frame_processing, resized, np.copy),
+        "face_definition": (lambda image: fv.face_definition(image, face), resized, np.copy),
+        "text_addition": (lambda image: fv.text_addition(image, vector), resized, np.copy),
+        "direction_vector_3d_with_returning_image": (fv.direction_vector_3d_with_returning_image, frames, None),
+        "hud_render": (lambda frame: hud.render(frame, face, vector), frames, None),
+    }
+    return {name: summary(measure(function, inputs, prepare, repeat=repeat))
+            for name, (function, inputs, prepare) in benchmarks.items()}
+
+
+def compare(results, baseline, tolerance, min_delta=0.05):
+    """Returns: list of regression messages, p50 or p95 slower than baseline by more than TOLERANCE
+    and by more than MIN_DELTA ms, so timer noise of sub-millisecond stages is ignored"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for key in ("p50", "p95"):
+            reference = baseline[name][key]
+            if reference > 0 and result[key] > reference * (1 + tolerance) and result[key] - reference > min_delta:
+                regressions.append(f"{name} {key}: {result[key]:.2f} ms vs baseline {reference:.2f} ms "
+                                   f"(+{(result[key] / reference - 1) * 100:.0f}%)")
+    return regressions
+
+
+def print_results(results, baseline=None):
+    print(f"{'stage':>42} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'fps':>8} {'vs p50':>7}")
+    for name, r in results.items():
+        change = ""
+        if baseline is not None and name in baseline and baseline[name]["p50"] > 0:
+            change = f"{(r['p50'] / baseline[name]['p50'] - 1) * 100:+.0f}%"
+        print(f"{name:>42} {r['p50']:8.2f} {r['p95']:8.2f} {r['p99']:8.2f} {r['fps']:8.1f} {change:>7}")
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Headless benchmark of the vision hot path")
+    parser.add_argument("--source", help="video file, frames directory or .npy stack, synthetic frames by default")
+    parser.add_argument("--frames", type=int, default=30, help="number of frames")
+    parser.add_argument("--repeat", type=int, default=1, help="passes over the frames")
+    parser.add_argument("--size", default="640x480", help="FaceVector image size WxH")
+    parser.add_argument("--profile", help="FaceVector detection profile")
+    parser.add_argument("--tracking-mode", default="full", help="FaceVector tracking mode")
+    parser.add_argument("--baseline", help="JSON baseline to compare with")
+    parser.add_argument("--save-baseline", help="write results as a new JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against baseline")
+    parser.add_argument("--min-delta", type=float, default=0.05, help="ignored slowdown (ms)")
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.split("x"))
+    frames = recorded_frames(args.source, args.frames) if args.source else synthetic_frames(args.frames)
+    if not frames:
+        print("No frames to benchmark")
+        sys.exit(2)
+    fv = FaceVector(height, width, tracking_mode=args.tracking_mode, profile=args.profile)
+    results = run_benchmarks(frames, fv, args.repeat)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print("Baseline saved to", args.save_baseline)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance, args.min_delta)
+        if regressions:
+            print("PERFORMANCE REGRESSION:")
+            for regression in regressions:
+                print("  " + regression)
+            sys.exit(1)
+        print("No regressions against", args.baseline)
+
+
+if __name__ == "__main__":
+    main()
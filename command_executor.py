@@ -0,0 +1,148 @@
+from collections import deque
+from threading import Thread, Condition
+from time import perf_counter
+
+
+class CommandExecutor:
+    """Executes discrete Tello commands (moves, rotations, takeoff, land) in its own thread,
+    so the render/vision thread never waits for the drone to finish a move.
+    Repeated presses of the same move are coalesced, priority commands cancel pending ones and jump the queue:
+    if a command is being executed, a priority one is sent right away from another thread on its own socket
+    (Tello.send_on_new_socket). The command being executed can not be aborted: the drone answers it only after
+    the move, a lost response ends it after Tello.FLYING_TIMEOUT"""
+
+    """Constants"""
+    MOVES = {"up": "up", "down": "down", "left": "left", "right": "right", "forward": "forward", "back": "back",
+             "cw": "rotate_cw", "ccw": "rotate_ccw"}
+    ACTIONS = {"takeoff": "takeoff", "land": "land", "stop": "stop"}
+    MAX_DISTANCE = 500  # cm
+    MAX_ANGLE = 360  # degrees
+    WINDOW = 100  # latencies kept for statistics
+
+    def __init__(self, tello):
+        self.tello = tello
+        self.pending = deque()
+        self.condition = Condition()
+        self.current = None
+        self.stopped = False
+
+        """Statistics"""
+        self.executed = 0
+        self.coalesced = 0
+        self.cancelled = 0
+        self.latencies = deque(maxlen=self.WINDOW)
+        self.execution_times = deque(maxlen=self.WINDOW)
+
+        self.worker = Thread(target=self.execute, daemon=True)
+
+    def start(self):
+        self.worker.start()
+        return self
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        if self.worker.is_alive():
+            self.worker.join(1)
+
+    def limit(self, name):
+        return self.MAX_ANGLE if name in ("cw", "ccw") else self.MAX_DISTANCE
+
+    def submit(self, name, value=None, callback=None):
+        """Queues a move (up, down, left, right, forward, back, cw, ccw with VALUE) or an action (takeoff, land, stop).
+        The same move as the last pending one is merged into it. CALLBACK(result) is called after execution"""
+        if name not in self.MOVES and name not in self.ACTIONS:
+            raise ValueError(f"Unknown command {name}")
+        with self.condition:
+            if name in self.MOVES and self.pending and self.pending[-1][0] == name and self.pending[-1][3] is None:
+                last = self.pending[-1]
+                merged = min(last[1] + value, self.limit(name))
+                self.pending[-1] = (name, merged, last[2], None)
+                self.coalesced += 1
+            else:
+                self.pending.append((name, value, perf_counter(), callback))
+            self.condition.notify()
+
+    def submit_priority(self, name, value=None, callback=None):
+        """Cancels all pending commands and puts NAME in front of the queue,
+        or sends it right away if the worker is busy with a command"""
+        with self.condition:
+            self.cancelled += len(self.pending)
+            self.pending.clear()
+            if self.current is None:
+                self.pending.append((name, value, perf_counter(), callback))
+                self.condition.notify()
+                return
+        Thread(target=self.execute_now, args=(name, value, perf_counter(), callback), daemon=True).start()
+
+    def execute_now(self, name, value, submitted, callback):
+        """Executes NAME beside the worker"""
+        try:
+            if name == "stop":  # an rc command, nothing to wait for
+                result = self.tello.stop()
+            else:
+                result = self.tello.send_on_new_socket(self.command_text(name, value))
+        except Exception as e:
+            result = e
+        with self.condition:
+            self.executed += 1
+            self.latencies.append(perf_counter() - submitted)
+        if callback is not None:
+            callback(result)
+
+    @staticmethod
+    def command_text(name, value):
+        """SDK command of a move or an action, the move names are the SDK ones"""
+        return f"{name} {value}" if value is not None else name
+
+    def cancel_pending(self):
+        with self.condition:
+            self.cancelled += len(self.pending)
+            self.pending.clear()
+
+    def execute(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending or self.stopped)
+                if self.stopped:
+                    return
+                name, value, submitted, callback = self.pending.popleft()
+                self.current = name
+            start = perf_counter()
+            try:
+                result = self.run_command(name, value)
+            except Exception as e:
+                result = e
+            finished = perf_counter()
+            with self.condition:
+                self.current = None
+                self.executed += 1
+                self.execution_times.append(finished - start)
+                self.latencies.append(finished - submitted)
+            if callback is not None:
+                callback(result)
+
+    def run_command(self, name, value):
+        if name in self.MOVES:
+            return getattr(self.tello, self.MOVES[name])(value)
+        return getattr(self.tello, self.ACTIONS[name])()
+
+    """Statistics"""
+
+    def queue_depth(self):
+        """Pending commands plus the one being executed"""
+        with self.condition:
+            return len(self.pending) + (1 if self.current is not None else 0)
+
+    def stats(self):
+        with self.condition:
+            latencies = list(self.latencies)
+            execution_times = list(self.execution_times)
+            return {"queue_depth": len(self.pending) + (1 if self.current is not None else 0),
+                    "current": self.current,
+                    "executed": self.executed,
+                    "coalesced": self.coalesced,
+                    "cancelled": self.cancelled,
+                    "mean_latency": sum(latencies) / len(latencies) if latencies else None,
+                    "mean_execution_time": sum(execution_times) / len(execution_times) if execution_times else None}
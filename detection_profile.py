@@ -0,0 +1,148 @@
+from math import sqrt
+from cv2 import resize, INTER_AREA
+
+
+class DetectionProfile:
+    """Detection settings: image downscale and detectMultiScale scale restrictions.
+    Detection runs on the downscaled image, found boxes are mapped back to full image coordinates"""
+
+    """Constants"""
+    MIN_SCALE_FACTOR = 1.05
+    MAX_SCALE_FACTOR = 1.3
+    WINDOW_SIZE = 24  # the smallest face size of the frontal face cascade
+
+    def __init__(self, name="full", downscale=1.0, scale_factor=None, min_size=None, max_size=None):
+        """Arguments: downscale: 0-1 image scale for detection,
+        scale_factor, min_size (w, h), max_size (w, h): detectMultiScale parameters in full image coordinates"""
+        self.name = name
+        self.downscale = downscale
+        self.scale_factor = scale_factor
+        self.min_size = min_size
+        self.max_size = max_size
+
+    @classmethod
+    def from_target(cls, name, width, height, target_square_ratio, delta_square_ratio,
+                    downscale=1.0, area_margin=4.0, levels=8):
+        """Profile for faces around the target face to frame square ratio.
+        Arguments: width, height: frame size, area_margin: how many times smaller or bigger than the target band
+        a face can be to still be found, levels: number of pyramid levels over the face size band"""
+        frame_square = width * height
+        min_area = max(target_square_ratio - delta_square_ratio, 0.0) * frame_square / area_margin
+        max_area = (target_square_ratio + delta_square_ratio) * frame_square * area_margin
+        min_side = max(int(sqrt(min_area)), cls.WINDOW_SIZE)
+        max_side = max(min(int(sqrt(max_area)), width, height), min_side + 1)
+        scale_factor = (max_side / min_side) ** (1 / levels)
+        scale_factor = min(max(scale_factor, cls.MIN_SCALE_FACTOR), cls.MAX_SCALE_FACTOR)
+        return cls(name, downscale, scale_factor, (min_side, min_side), (max_side, max_side))
+
+    def detection_sizes(self):
+        """min_size and max_size in downscaled image coordinates"""
+        min_size, max_size = self.min_size, self.max_size
+        if min_size is not None:
+            min_size = tuple(max(int(v * self.downscale), self.WINDOW_SIZE) for v in min_size)
+        if max_size is not None:
+            max_size = tuple(max(int(v * self.downscale), self.WINDOW_SIZE + 1) for v in max_size)
+        return min_size, max_size
+
+    def detect(self, detector, image):
+        """Returns faces (x, y, w, h) found by the DETECTOR on the BGR image in full image coordinates"""
+        if self.downscale != 1.0:
+            small = resize(image, None, fx=self.downscale, fy=self.downscale, interpolation=INTER_AREA)
+        else:
+            small = image
+        min_size, max_size = self.detection_sizes()
+        faces = detector.detect(small, self.scale_factor, min_size, max_size)
+        if self.downscale == 1.0 or len(faces) == 0:
+            return faces
+        return [tuple(int(round(v / self.downscale)) for v in face) for face in faces]
+
+    def __repr__(self):
+        return (f"DetectionProfile({self.name!r}, downscale={self.downscale}, scale_factor={self.scale_factor}, "
+                f"min_size={self.min_size}, max_size={self.max_size})")
+
+
+def default_profiles(width, height, target_square_ratio, delta_square_ratio):
+    """Returns: dict of profiles from the most accurate to the fastest"""
+    profiles = [DetectionProfile("full"),
+                DetectionProfile.from_target("banded", width, height, target_square_ratio, delta_square_ratio),
+                DetectionProfile.from_target("balanced", width, height, target_square_ratio, delta_square_ratio,
+                                             downscale=0.5),
+                DetectionProfile.from_target("fast", width, height, target_square_ratio, delta_square_ratio,
+                                             downscale=0.35, levels=6)]
+    return {profile.name: profile for profile in profiles}
+
+
+def iou(a, b):
+    """Intersection over union of two boxes (x, y, w, h)"""
+    (ax, ay, aw, ah), (bx, by, bw, bh) = a, b
+    w = min(ax + aw, bx + bw) - max(ax, bx)
+    h = min(ay + ah, by + bh) - max(ay, by)
+    if w <= 0 or h <= 0:
+        return 0.0
+    intersection = w * h
+    return float(intersection / (aw * ah + bw * bh - intersection))
+
+
+def benchmark_profiles(fv, frames, profiles):
+    """Latency and accuracy of every profile against the "full" profile on the same frames.
+    Returns: list of dicts with mean and p95 latency (s), recall, mean IoU and false detections"""
+    from time import perf_counter
+    images = [resize(frame, (fv.width, fv.height)) for frame in frames]
+    reference = [profiles["full"].detect(fv.detector, image) for image in images]
+    results = []
+    for profile in profiles.values():
+        latencies = []
+        found, ious, false_detections, expected = 0, [], 0, 0
+        for image, reference_faces in zip(images, reference):
+            start = perf_counter()
+            faces = profile.detect(fv.detector, image)
+            latencies.append(perf_counter() - start)
+            if len(reference_faces) > 0:
+                expected += 1
+                if len(faces) > 0:
+                    found += 1
+                    ious.append(max(iou(face, reference_face) for face in faces for reference_face in reference_faces))
+            elif len(faces) > 0:
+                false_detections += 1
+        latencies.sort()
+        results.append({"profile": profile.name,
+                        "mean": sum(latencies) / len(latencies),
+                        "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+                        "recall": found / expected if expected else None,
+                        "iou": sum(ious) / len(ious) if ious else None,
+                        "false_detections": false_detections})
+    return results
+
+
+def main():
+    import sys
+    from cv2 import VideoCapture
+    from face_vector import FaceVector
+    source = sys.argv[1] if len(sys.argv) > 1 else 0
+    frames_number = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    capture = VideoCapture(source)
+    frames = []
+    while len(frames) < frames_number:
+        r, frame = capture.read()
+        if not r:
+            break
+        frames.append(frame)
+    capture.release()
+    if not frames:
+        print("No frames read from", source)
+        return
+
+    fv = FaceVector(720, 960)
+    profiles = default_profiles(fv.width, fv.height, fv.target_square_ratio, fv.delta_square_ratio)
+    for profile in profiles.values():
+        print(profile)
+    print(f"{'profile':>10} {'mean ms':>8} {'p95 ms':>8} {'recall':>7} {'iou':>6} {'false':>6}")
+    for r in benchmark_profiles(fv, frames, profiles):
+        recall = f"{r['recall']:.2f}" if r['recall'] is not None else "-"
+        mean_iou = f"{r['iou']:.2f}" if r['iou'] is not None else "-"
+        print(f"{r['profile']:>10} {r['mean'] * 1000:8.1f} {r['p95'] * 1000:8.1f} {recall:>7} {mean_iou:>6} "
+              f"{r['false_detections']:>6}")
+
+
+if __name__ == "__main__":
+    main()
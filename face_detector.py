@@ -0,0 +1,298 @@
+import os
+from threading import local, Lock
+from time import perf_counter
+import numpy as np
+from cv2 import CascadeClassifier, cvtColor, resize, COLOR_BGR2GRAY, COLOR_GRAY2BGR, INTER_CUBIC, data, dnn
+
+
+class FaceDetector:
+    """Haar cascade face detector.
+    The cascade file is parsed once per worker thread and the classifier is reused for every next frame,
+    so concurrent callers never share OpenCV state."""
+
+    """Constants"""
+    NAME = "haar"
+    COST = 1.0  # expected detection time relative to the Haar cascade
+    ACCURACY = 2  # rank among the backends, higher is more accurate
+    CASCADE_NAME = 'haarcascade_frontalface_default.xml'
+    RESOURCES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources')
+
+    def __init__(self, cascade_path=None):
+        """Arguments: cascade_path: path to cascade xml file, the one from resources folder is used by default"""
+        self.cascade_path = cascade_path if cascade_path is not None else self.default_cascade_path()
+        self._local = local()
+        self._lock = Lock()
+
+        """Statistics"""
+        self.loads = 0
+        self.load_time = 0.0
+        self.detections = 0
+        self.detection_time = 0.0
+        self.last_detection_time = 0.0
+
+    @classmethod
+    def default_cascade_path(cls):
+        """Cascade shipped in the repo resources, OpenCV bundled one if it is missing"""
+        path = os.path.join(cls.RESOURCES_PATH, cls.CASCADE_NAME)
+        if os.path.isfile(path):
+            return path
+        return data.haarcascades + cls.CASCADE_NAME
+
+    @classmethod
+    def available(cls):
+        """True if the model file of the backend is there"""
+        return os.path.isfile(cls.default_cascade_path())
+
+    def load(self):
+        """Loads cascade for the current thread"""
+        start = perf_counter()
+        classifier = CascadeClassifier(self.cascade_path)
+        elapsed = perf_counter() - start
+        if classifier.empty():
+            raise IOError(f"Can not load cascade from {self.cascade_path}")
+        with self._lock:
+            self.loads += 1
+            self.load_time += elapsed
+        return classifier
+
+    @property
+    def classifier(self):
+        """Classifier of the current thread"""
+        classifier = getattr(self._local, 'classifier', None)
+        if classifier is None:
+            classifier = self.load()
+            self._local.classifier = classifier
+        return classifier
+
+    @staticmethod
+    def detection_parameters(scale_factor=None, min_size=None, max_size=None):
+        """detectMultiScale keyword arguments, OpenCV defaults are used for missing ones"""
+        parameters = {}
+        if scale_factor is not None:
+            parameters["scaleFactor"] = scale_factor
+        if min_size is not None:
+            parameters["minSize"] = tuple(min_size)
+        if max_size is not None:
+            parameters["maxSize"] = tuple(max_size)
+        return parameters
+
+    def detect_gray(self, img_gray, scale_factor=None, min_size=None, max_size=None):
+        """Returns faces (x, y, w, h) found on the gray image.
+        Arguments: scale_factor, min_size (w, h), max_size (w, h): optional detectMultiScale restrictions"""
+        classifier = self.classifier
+        parameters = self.detection_parameters(scale_factor, min_size, max_size)
+        start = perf_counter()
+        faces = classifier.detectMultiScale(image=img_gray, **parameters)
+        self.add_detection_time(perf_counter() - start)
+        return faces
+
+    def detect(self, image, scale_factor=None, min_size=None, max_size=None):
+        """Returns faces (x, y, w, h) found on the BGR image"""
+        return self.detect_gray(cvtColor(image, COLOR_BGR2GRAY), scale_factor, min_size, max_size)
+
+    """Statistics"""
+
+    def add_detection_time(self, elapsed):
+        with self._lock:
+            self.detections += 1
+            self.detection_time += elapsed
+            self.last_detection_time = elapsed
+
+    def mean_detection_time(self):
+        if self.detections == 0:
+            return 0.0
+        return self.detection_time / self.detections
+
+    def stats(self):
+        with self._lock:
+            return {"loads": self.loads,
+                    "load_time": self.load_time,
+                    "detections": self.detections,
+                    "detection_time": self.detection_time,
+                    "last_detection_time": self.last_detection_time,
+                    "mean_detection_time": self.detection_time / self.detections if self.detections else 0.0}
+
+    def close(self):
+        """Nothing to release, same interface as ProcessFaceDetector"""
+        pass
+
+
+class LBPFaceDetector(FaceDetector):
+    """LBP cascade face detector: about three times faster than the Haar one and less accurate.
+    OpenCV Python packages do not include LBP cascades, the OpenCV lbpcascade_frontalface.xml is in resources"""
+
+    """Constants"""
+    NAME = "lbp"
+    COST = 0.35
+    ACCURACY = 1
+    CASCADE_NAME = 'lbpcascade_frontalface.xml'
+
+
+class DNNFaceDetector(FaceDetector):
+    """OpenCV DNN face detector: the res10 300x300 SSD Caffe model, the most accurate backend, also with turned
+    and partly hidden faces. The model is not shipped, put deploy.prototxt and
+    res10_300x300_ssd_iter_140000.caffemodel (opencv/samples/dnn/face_detector) to the resources folder.
+    The network is loaded once per worker thread like the cascades. scale_factor is not used,
+    min_size and max_size filter the found boxes"""
+
+    """Constants"""
+    NAME = "dnn"
+    COST = 1.5
+    ACCURACY = 3
+    MODEL_NAME = 'res10_300x300_ssd_iter_140000.caffemodel'
+    CONFIG_NAME = 'deploy.prototxt'
+    INPUT_SIZE = (300, 300)
+    MEAN = (104.0, 177.0, 123.0)
+    CONFIDENCE = 0.5
+
+    def __init__(self, model_path=None, config_path=None, confidence=CONFIDENCE):
+        """Arguments: model_path, config_path: Caffe model and its prototxt, the ones from resources folder
+        are used by default, confidence: the lowest score of a face"""
+        super().__init__(model_path)
+        self.config_path = config_path if config_path is not None else os.path.join(self.RESOURCES_PATH,
+                                                                                     self.CONFIG_NAME)
+        self.confidence = confidence
+
+    @classmethod
+    def default_cascade_path(cls):
+        return os.path.join(cls.RESOURCES_PATH, cls.MODEL_NAME)
+
+    @classmethod
+    def available(cls):
+        return os.path.isfile(cls.default_cascade_path()) and os.path.isfile(os.path.join(cls.RESOURCES_PATH,
+                                                                                           cls.CONFIG_NAME))
+
+    def load(self):
+        """Loads the network for the current thread"""
+        start = perf_counter()
+        try:
+            net = dnn.readNetFromCaffe(self.config_path, self.cascade_path)
+        except Exception as e:
+            raise IOError(f"Can not load DNN model from {self.cascade_path}: {e}")
+        elapsed = perf_counter() - start
+        with self._lock:
+            self.loads += 1
+            self.load_time += elapsed
+        return net
+
+    def detect_gray(self, img_gray, scale_factor=None, min_size=None, max_size=None):
+        return self.detect(cvtColor(img_gray, COLOR_GRAY2BGR), scale_factor, min_size, max_size)
+
+    def detect(self, image, scale_factor=None, min_size=None, max_size=None):
+        """Returns faces (x, y, w, h) found on the BGR image, the most confident first"""
+        net = self.classifier
+        height, width = image.shape[:2]
+        start = perf_counter()
+        net.setInput(dnn.blobFromImage(image, 1.0, self.INPUT_SIZE, self.MEAN))
+        detections = net.forward()[0, 0]
+        self.add_detection_time(perf_counter() - start)
+        faces = []
+        for _, _, confidence, x0, y0, x1, y1 in detections:
+            if confidence < self.confidence:
+                continue
+            x, y = int(max(x0, 0.0) * width), int(max(y0, 0.0) * height)
+            w, h = int(min(x1, 1.0) * width) - x, int(min(y1, 1.0) * height) - y
+            if w <= 0 or h <= 0:
+                continue
+            if min_size is not None and (w < min_size[0] or h < min_size[1]):
+                continue
+            if max_size is not None and (w > max_size[0] or h > max_size[1]):
+                continue
+            faces.append((x, y, w, h))
+        return faces
+
+
+"""Backends"""
+
+DETECTORS = {"haar": FaceDetector, "lbp": LBPFaceDetector, "dnn": DNNFaceDetector}
+
+DETECTION_SHARE = 0.7  # share of the frame period detection may take
+
+
+def available_detectors():
+    """Returns: names of the backends with model files, from the most accurate"""
+    return [name for name, cls in sorted(DETECTORS.items(), key=lambda item: -item[1].ACCURACY) if cls.available()]
+
+
+def create_detector(backend):
+    """Arguments: backend: "haar", "lbp" or "dnn" """
+    if backend not in DETECTORS:
+        raise ValueError(f"Unknown detector backend {backend}, known: {', '.join(DETECTORS)}")
+    if not DETECTORS[backend].available():
+        raise IOError(f"Model of the {backend} detector is missing, see {DETECTORS[backend].__name__} description")
+    return DETECTORS[backend]()
+
+
+def benchmark_frames(number=5, width=640, height=480):
+    """Low frequency noise frames: costs cascades about as much as real video, unlike blank or white noise frames"""
+    rng = np.random.default_rng(0)
+    return [resize(rng.integers(0, 256, (height // 16, width // 16, 3), np.uint8), (width, height),
+                   interpolation=INTER_CUBIC) for _ in range(number)]
+
+
+def select_detector(target_fps, frames=None, profile=None, share=DETECTION_SHARE):
+    """Picks the most accurate available backend whose mean detection time fits SHARE of the frame period.
+    Backends are benchmarked on FRAMES (benchmark_frames() by default) with PROFILE (DetectionProfile, optional)
+    from the most accurate, a backend declaring a higher cost than one that did not fit is not benchmarked.
+    If none fits, the fastest one is taken.
+    Returns: (detector, list of dicts with backend, declared cost, measured mean time (s) or None, fits)"""
+    budget = share / target_fps
+    frames = frames if frames is not None else benchmark_frames()
+    results = []
+    chosen, fastest, missed_cost = None, None, None
+    for name in available_detectors():
+        cls = DETECTORS[name]
+        result = {"backend": name, "cost": cls.COST, "mean": None, "fits": False}
+        results.append(result)
+        if chosen is not None or (missed_cost is not None and cls.COST >= missed_cost):
+            continue
+        detector = cls()
+        detect = detector.detect if profile is None else lambda frame: profile.detect(detector, frame)
+        detect(frames[0])  # loading and first run allocations are not counted
+        start = perf_counter()
+        for frame in frames:
+            detect(frame)
+        result["mean"] = (perf_counter() - start) / len(frames)
+        result["fits"] = result["mean"] <= budget
+        if result["fits"]:
+            chosen = detector
+        else:
+            missed_cost = cls.COST if missed_cost is None else min(missed_cost, cls.COST)
+            if fastest is None or result["mean"] < fastest[0]:
+                fastest = (result["mean"], detector)
+    if chosen is None:
+        if fastest is None:
+            raise IOError("No face detector is available")
+        chosen = fastest[1]
+    return chosen, results
+
+
+def main():
+    """python face_detector.py [haar|lbp|dnn|auto] detects faces on the webcam video"""
+    import sys
+    from cv2 import VideoCapture, imshow, waitKey, rectangle
+    backend = sys.argv[1] if len(sys.argv) > 1 else "haar"
+    if backend == "auto":
+        detector, results = select_detector(20)
+        for result in results:
+            print(result)
+        print("Selected", detector.NAME)
+    else:
+        detector = create_detector(backend)
+    capture = VideoCapture(0)
+    while True:
+        r, i = capture.read()
+        if r:
+            for (x, y, w, h) in detector.detect(i):
+                rectangle(i, (x, y), (x + w, y + h), (255, 0, 0), 2)
+            imshow("", i)
+            stats = detector.stats()
+            print(f"load: {stats['load_time'] * 1000:.1f} ms, "
+                  f"detection: {stats['last_detection_time'] * 1000:.1f} ms "
+                  f"(mean {stats['mean_detection_time'] * 1000:.1f} ms)")
+        if waitKey(1) & 0xFF == ord('q'):
+            break
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+from threading import Lock
+from time import time
+import numpy as np
+
+
+class FacePredictor:
+    """Constant velocity Kalman filter over the face centre and size (square root of the face area).
+    Measurements are taken with frame capture timestamps and predictions are made for the moment a command is sent,
+    so the tracker steers to where the face is now rather than where it was when the frame was captured.
+    Predictions continue through detection dropouts shorter than max_dropout"""
+
+    """Constants"""
+    MAX_DROPOUT = 0.5  # seconds of prediction without measurements before the track is dropped
+    POSITION_NOISE = 6.0  # centre measurement noise, pixels
+    SIZE_NOISE = 4.0  # size measurement noise, pixels
+    ACCELERATION_NOISE = 600.0  # centre acceleration noise, pixels/s^2
+    SIZE_ACCELERATION_NOISE = 150.0  # size acceleration noise, pixels/s^2
+    INITIAL_VELOCITY_NOISE = 300.0  # velocity uncertainty of a new track, pixels/s
+
+    def __init__(self, max_dropout=MAX_DROPOUT):
+        self.max_dropout = max_dropout
+        self.lock = Lock()
+        self.H = np.hstack((np.eye(3), np.zeros((3, 3))))
+        self.R = np.diag([self.POSITION_NOISE ** 2, self.POSITION_NOISE ** 2, self.SIZE_NOISE ** 2])
+        self.q = np.array([self.ACCELERATION_NOISE, self.ACCELERATION_NOISE, self.SIZE_ACCELERATION_NOISE]) ** 2
+        self.x = np.zeros(6)  # cx, cy, size, their velocities
+        self.P = np.eye(6)
+        self.timestamp = None  # time of the state
+        self.last_measurement = None
+        self.dropout = False  # the last frame had no face
+
+        """Statistics"""
+        self.updates = 0
+        self.misses = 0
+        self.predictions = 0
+        self.dropout_predictions = 0  # predictions made during detection dropouts
+        self.tracks = 0
+
+    def reset(self):
+        with self.lock:
+            self.timestamp = None
+            self.last_measurement = None
+
+    def transition(self, dt):
+        """Returns: transition matrix F and process noise Q for DT seconds"""
+        F = np.eye(6)
+        F[0, 3] = F[1, 4] = F[2, 5] = dt
+        Q = np.zeros((6, 6))
+        for i in range(3):
+            Q[i, i] = self.q[i] * dt ** 4 / 4
+            Q[i, i + 3] = Q[i + 3, i] = self.q[i] * dt ** 3 / 2
+            Q[i + 3, i + 3] = self.q[i] * dt ** 2
+        return F, Q
+
+    @staticmethod
+    def measurement(face):
+        (x, y, w, h) = face
+        return np.array([x + w / 2, y + h / 2, (w * h) ** 0.5])
+
+    def lost(self, timestamp):
+        return self.last_measurement is None or timestamp - self.last_measurement > self.max_dropout
+
+    def update(self, face, timestamp):
+        """Arguments: face: (x, y, w, h) found on the frame or None, timestamp: frame capture time (time())"""
+        with self.lock:
+            if face is None:
+                self.misses += 1
+                self.dropout = True
+                return
+            z = self.measurement(face)
+            if self.lost(timestamp):
+                self.x = np.concatenate((z, np.zeros(3)))
+                self.P = np.diag(np.concatenate((np.diag(self.R), np.full(3, self.INITIAL_VELOCITY_NOISE ** 2))))
+                self.tracks += 1
+            else:
+                F, Q = self.transition(max(0.0, timestamp - self.timestamp))
+                x = F @ self.x
+                P = F @ self.P @ F.T + Q
+                S = self.H @ P @ self.H.T + self.R
+                K = P @ self.H.T @ np.linalg.inv(S)
+                self.x = x + K @ (z - self.H @ x)
+                self.P = (np.eye(6) - K @ self.H) @ P
+            self.timestamp = max(timestamp, self.timestamp) if self.timestamp is not None else timestamp
+            self.last_measurement = self.timestamp
+            self.dropout = False
+            self.updates += 1
+
+    def predict(self, timestamp=None):
+        """Arguments: timestamp: time to predict for, now by default.
+        Returns: predicted face (x, y, w, h) or None if there is no track"""
+        if timestamp is None:
+            timestamp = time()
+        with self.lock:
+            if self.lost(timestamp):
+                return None
+            F, _ = self.transition(max(0.0, timestamp - self.timestamp))
+            cx, cy, size = (F @ self.x)[:3]
+            self.predictions += 1
+            if self.dropout:
+                self.dropout_predictions += 1
+        size = max(1.0, size)
+        return int(cx - size / 2), int(cy - size / 2), int(size), int(size)
+
+    def stats(self):
+        return {"updates": self.updates,
+                "misses": self.misses,
+                "tracks": self.tracks,
+                "predictions": self.predictions,
+                "dropout_predictions": self.dropout_predictions}
+
+
+def main():
+    """Compares the error of steering by the last detected face and by the prediction
+    on a face moving in front of the camera with video delay and detection dropouts"""
+    rng = np.random.default_rng(0)
+    fps, delay, duration = 20, 0.15, 20.0
+    predictor = FacePredictor()
+    last_face = None
+    raw_errors, predicted_errors = [], []
+    for step in range(int(duration * fps)):
+        t = step / fps
+        true_face = (320 + 200 * np.sin(0.8 * t), 240 + 80 * np.sin(1.3 * t), 80 + 20 * np.sin(0.5 * t))
+        captured = t - delay
+        if step % 25 < 20:  # 5 frames out of every 25 without a face
+            cx, cy, size = (320 + 200 * np.sin(0.8 * captured), 240 + 80 * np.sin(1.3 * captured),
+                            80 + 20 * np.sin(0.5 * captured))
+            cx, cy, size = cx + rng.normal(0, 3), cy + rng.normal(0, 3), size + rng.normal(0, 2)
+            last_face = (int(cx - size / 2), int(cy - size / 2), int(size), int(size))
+            predictor.update(last_face, captured)
+        else:
+            predictor.update(None, captured)
+        predicted = predictor.predict(t)
+        for face, errors in ((last_face, raw_errors), (predicted, predicted_errors)):
+            if face is not None:
+                centre = FacePredictor.measurement(face)
+                errors.append(np.hypot(centre[0] - true_face[0], centre[1] - true_face[1]))
+    for name, errors in (("last detection", raw_errors), ("prediction", predicted_errors)):
+        errors = np.array(errors)
+        print(f"{name:>15}: mean error {errors.mean():.1f} px, p95 {np.percentile(errors, 95):.1f} px")
+    print(predictor.stats())
+
+
+if __name__ == "__main__":
+    main()
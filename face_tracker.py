@@ -1,6 +1,17 @@
 from tello import Tello
+from command_executor import CommandExecutor
+from rc_scheduler import RCScheduler
 from face_vector import FaceVector
-from time import sleep
+from face_predictor import FacePredictor
+from hud import HUD
+from key_source import StdinKeySource
+from preview_server import MJPEGServer
+from tracking_controller import DiscreteController, PIDController, SettleMetrics
+from pipeline import DropOldestQueue, LatestSlot, RateScheduler, Stage, format_stats
+from metrics import METRICS
+from profiler import StageHooks, ProfileCapture
+from time import sleep, perf_counter, time
+from threading import Lock, Thread
 from cv2 import imshow, waitKey, namedWindow, imread
 
 
@@ -11,15 +22,35 @@ class FaceTracker:
     UD_S = 25
     CW_S = 25  # CW/CCW Speed of the drone
     FPS = 20  # Frames per second of the pygame window display
+    RC_RATE = 10  # RC commands per second sent by the scheduler
+    QUEUE_SIZE = 1  # Length of queues between pipeline stages
+    VECTOR_MAX_AGE = 0.5  # Directions vector older than this (s) is not used for driving
+    STATS_PERIOD = 5  # Seconds between pipeline statistics reports
 
-    def __init__(self, height, width):
-        """Start loading"""
-        namedWindow("drone")
-        self.paper = imread("./resources/Tello.png")
+    def __init__(self, height, width, detector=None, tracking_mode="full", profile=None, tello=None,
+                 control_mode="discrete", predict=False, headless=False, key_source=None, preview_address=None,
+                 recorder=None):
+        """Start loading. Arguments: detector: FaceDetector or ProcessFaceDetector used by FaceVector (optional),
+        tracking_mode: FaceVector tracking mode, profile: FaceVector detection profile,
+        tello: Tello to control, e.g. Tello("127.0.0.1") for the local simulator (optional),
+        control_mode: "discrete" for fixed speeds from the directions vector, "pid" for continuous PID control,
+        predict: steer to the face position predicted for the command time by FacePredictor,
+        headless: no HighGUI windows, keys come from KEY_SOURCE (StdinKeySource by default),
+        the video is previewed as MJPEG at PREVIEW_ADDRESS (MJPEGServer.ADDRESS by default),
+        recorder: started FlightRecorder relaying the video to the tello video address (optional).
+        The window, the picture and the video capture are created when they are first needed"""
+        self.created = perf_counter()
+        self.headless = headless
+        if headless:
+            self.key_source = key_source if key_source is not None else StdinKeySource()
+            self.preview_address = preview_address if preview_address is not None else MJPEGServer.ADDRESS
+        self.window = False
+        self.preview = None
+        self.paper = None
         self.height = height
         self.width = width
-        self.fv = FaceVector(height, width)
-        self.tello = Tello()
+        self.fv = FaceVector(height, width, detector, tracking_mode, self.FPS, profile)
+        self.tello = tello if tello is not None else Tello()
         # Drone velocities between -100~100
         self.for_back_velocity = 20
         self.left_right_velocity = 20
@@ -27,80 +58,349 @@ class FaceTracker:
         self.yaw_velocity = 20
         self.speed = 20
         self.send_rc_control = False
+        self.landings = 0  # land commands issued, a takeoff finished after a land does not enable RC
+        self.flight_lock = Lock()
         self.should_stop = False
         self.mode = "keyboard"
+        # Discrete moves are executed off the render/vision thread
+        self.executor = CommandExecutor(self.tello)
+        # The latest velocities are sent at a fixed rate
+        self.rc_scheduler = RCScheduler(self.tello, self.RC_RATE)
+        self.control_mode = control_mode
+        if control_mode == "pid":
+            self.controller = PIDController(width, height, self.fv.target_square_ratio,
+                                            self.LR_S, self.UD_S, self.FB_S, self.CW_S)
+        elif control_mode == "discrete":
+            self.controller = DiscreteController(self.LR_S, self.UD_S, self.FB_S, self.CW_S,
+                                                 (self.left_right_velocity, self.for_back_velocity,
+                                                  self.up_down_velocity, self.yaw_velocity))
+        else:
+            raise ValueError(f"Unknown control mode {control_mode}")
+        # Annotates frames only when there is a display
+        self.hud = None
+        # Records detection results, setpoints and telemetry next to the raw video
+        self.recorder = recorder
+        # Compensates the video delay and bridges short detection dropouts
+        self.predictor = FacePredictor() if predict else None
+        self.settle_metrics = SettleMetrics(width * self.fv.target_face_region_ratio,
+                                            height * self.fv.target_face_region_ratio)
+        # User callbacks at stage boundaries, also feed the timeline of a profile capture (P key)
+        self.hooks = StageHooks()
+        self.profile_capture = ProfileCapture(self.hooks)
+        # Seconds since creation: command bring-up, detector warm up, first frame, first detection, first face
+        self.startup = {}
+        self.hooks.add("frame_acquired", self.on_startup_event)
+        self.hooks.add("faces_detected", self.on_startup_event)
 
-    def run(self, show=False, debug=False):
+    def start_stream(self):
+        """Connecting and stream start. The commands are sent from a separate thread, meanwhile the frame reading
+        thread opens the video capture and the detector is warmed up in this thread.
+        Returns: bool: True for successful, False for unsuccessful"""
+        self.tello.server.start_background_read()
+        result = []
+        commands = Thread(target=lambda: result.append(self.bring_up()), daemon=True)
+        commands.start()
+        self.startup["warm_up"] = self.fv.warm_up()
+        commands.join()
+        if not result[0]:
+            self.tello.server.stop_background_read()
+            return False
+        self.startup["bring_up"] = perf_counter() - self.created
+        self.executor.start()
+        self.rc_scheduler.start()
+        if self.headless:
+            self.key_source.start()
+        if self.recorder is not None:
+            self.tello.start_state_listener()
+        return True
+
+    def bring_up(self):
+        """Connecting and stream start commands. Returns: bool: True for successful, False for unsuccessful"""
+        try:
+            return self.bring_up_commands()
+        except OSError as e:  # no response
+            print("Bring-up failed:", e)
+            return False
+
+    def bring_up_commands(self):
         """Connecting block"""
-        if not self.tello.connect():
-            return
+        if self.tello.connect() is not True:  # (False, error) when there is no response
+            return False
         print("Connected")
-        if not self.tello.set_speed(self.speed):
-            return
+        if self.tello.set_speed(self.speed) is not True:
+            return False
         print("Speeds set")
 
         """Stream start block"""
         if not self.tello.streamoff():
-            return
+            return False
         if not self.tello.streamon():
-            return
-        cap = self.tello.server.get_video_capture()
+            return False
         print("Stream started")
+        return True
+
+    def on_startup_event(self, event, timestamp, data):
+        """Startup hook: records the first frame, detection and face, then removes itself"""
+        since_created = timestamp - self.created
+        if event == "frame_acquired":
+            self.hooks.remove(event, self.on_startup_event)
+            self.startup["first_frame"] = since_created
+            return
+        self.startup.setdefault("first_detection", since_created)
+        if data["face"] is not None:
+            self.hooks.remove(event, self.on_startup_event)
+            self.startup["first_face"] = since_created
+            print("Startup:", self.startup_stats())
+
+    def startup_stats(self):
+        """Returns: dict of startup steps with seconds since the tracker creation (warm_up is its own duration)"""
+        return {name: round(self.startup[name], 3) for name in
+                ("bring_up", "warm_up", "first_frame", "first_detection", "first_face") if name in self.startup}
+
+    def run(self, show=False, debug=False):
+        if not self.start_stream():
+            return
+        seq = 0
+        self.start_display(show or debug)
 
         """Main loop"""
         while not self.should_stop:
             vec = None
+            pixel_vector = None
+            face = None
             """Frame reading block"""
             if self.mode == "tracking" or show or debug:
-                try:
-                    r, frame = cap.read()
-                except ValueError:
-                    continue
-                if r:
+                with METRICS.timer("frame_read"):
+                    latest = self.tello.server.wait_for_newer(seq, 1 / self.FPS)
+                if latest is not None:
+                    seq, timestamp, frame = latest
+                    METRICS.inc("frames")
+                    self.hooks.emit("frame_acquired", seq=seq, timestamp=timestamp, frame=frame)
                     """Creating target directions vector"""
-                    if self.mode == "tracking" or debug:
-                        vec, frame = self.fv.direction_vector_3d_with_returning_image(frame)
+                    analysed = self.mode == "tracking" or debug
+                    if analysed:
+                        with METRICS.timer("detection"):
+                            vec, face = self.fv.direction_vector_3d_with_face(frame)
+                        self.hooks.emit("faces_detected", seq=seq, face=face)
+                        pixel_vector = self.fv.pixel_vector_3d(face)
+                        if self.predictor is not None:
+                            self.predictor.update(face, timestamp)
+                        self.hooks.emit("vector_computed", seq=seq, vec=vec, pixel_vector=pixel_vector)
+                        self.record_frame(seq, timestamp, face, vec)
                     """Frame plotting(requires from argument: bool:SHOW)"""
-                    if show or debug:
-                        frame = self.fv.text_addition(frame, vec)
-                        imshow("drone", frame)
-            if (not show) and (not debug):
-                imshow("drone", self.paper)
-            key = waitKey(5) & 0xff
+                    if self.hud is not None:
+                        with METRICS.timer("drawing"):
+                            self.display((frame, analysed, face, vec))
+            with METRICS.timer("key_wait"):
+                key = self.read_key()
 
             """Keyboard commands getting"""
             self.check_key(key)
 
             if self.mode == "tracking":
-                """Driving block"""
-                if vec is None:
-                    vec = [0, 0, 0]
-                print(vec)
-
-                """Setting velocities depending from directions vector VEC"""
-                if vec[0] != 0 or vec[1] != 0:
-                    """Moving in 2D space at first"""
-                    # set left/right velocity
-                    self.left_right_velocity = -self.LR_S * vec[0]
-                    # set up/down velocity
-                    self.up_down_velocity = self.UD_S * vec[1]
-                    # set forward/backward velocity
-                else:
-                    """Then moving forward/backward"""
-                    self.for_back_velocity = self.FB_S * vec[2]
-                    # set yaw clockwise velocity
-                    self.yaw_velocity = self.CW_S * 0
-                """Send move commands"""
-                self.update()
+                if self.predictor is not None:
+                    vec, pixel_vector = self.predicted_vectors()
+                with METRICS.timer("control"):
+                    self.drive(vec, pixel_vector, seq)
 
             sleep(1 / self.FPS)
+        if debug:
+            print("Settle:", self.settle_metrics.summary())
+            print("Startup:", self.startup_stats())
+        self.executor.stop()
+        self.rc_scheduler.stop()
+        self.stop_display()
+        if self.recorder is not None:
+            self.recorder.stop()
         self.tello.end()
 
+    def run_pipelined(self, show=False, debug=False, detection_stages=1):
+        """Capture, detection, control and display work as separate stages connected by drop-oldest queues.
+        Control uses the freshest directions vector at a fixed rate, display and keyboard stay in the main thread.
+        Several detection stages make sense with ProcessFaceDetector. They share one FaceVector, so they work
+        only with the stateless "full" tracking mode: "roi" and "hybrid" keep the track between frames"""
+        if detection_stages > 1 and self.fv.tracking_mode != "full":
+            raise ValueError(f"{self.fv.tracking_mode} tracking mode keeps state between frames, "
+                             f"it works with one detection stage only")
+        if not self.start_stream():
+            return
+        server = self.tello.server
+        frames = DropOldestQueue(max(self.QUEUE_SIZE, detection_stages))
+        images = DropOldestQueue(self.QUEUE_SIZE)
+        vectors = LatestSlot()
+        scheduler = RateScheduler(self.FPS)
+        captured = [0]
+
+        def next_frame():
+            latest = server.wait_for_newer(captured[0], 1 / self.FPS)
+            if latest is not None:
+                captured[0] = latest[0]
+                self.hooks.emit("frame_acquired", seq=latest[0], timestamp=latest[1], frame=latest[2])
+            return latest
+
+        detected = [0]
+        detected_lock = Lock()
+
+        def detect(latest):
+            seq, timestamp, frame = latest
+            vec = None
+            pixel_vector = None
+            face = None
+            analysed = self.mode == "tracking" or debug
+            if analysed:
+                vec, face = self.fv.direction_vector_3d_with_face(frame)
+                self.hooks.emit("faces_detected", seq=seq, face=face)
+                pixel_vector = self.fv.pixel_vector_3d(face)
+            with detected_lock:
+                if seq < detected[0]:
+                    return
+                detected[0] = seq
+                if self.mode == "tracking" or debug:
+                    vectors.put((vec, pixel_vector, seq))
+                    if self.predictor is not None:
+                        self.predictor.update(face, timestamp)
+                    self.hooks.emit("vector_computed", seq=seq, vec=vec, pixel_vector=pixel_vector)
+                    self.record_frame(seq, timestamp, face, vec)
+                if show or debug:
+                    images.put((frame, analysed, face, vec))
+
+        def next_tick():
+            scheduler.wait()
+            return True
+
+        def control(_):
+            if self.mode != "tracking":
+                return
+            if self.predictor is not None:
+                self.drive(*self.predicted_vectors())
+                return
+            _, _, latest = vectors.get()
+            vec, pixel_vector, seq = latest if latest is not None else (None, None, None)
+            age = vectors.age()
+            if age is None or age > self.VECTOR_MAX_AGE:
+                vec, pixel_vector, seq = None, None, None
+            self.drive(vec, pixel_vector, seq)
+
+        stages = [Stage("capture", frames.put, next_frame)]
+        stages += [Stage(f"detection{i}" if detection_stages > 1 else "detection", detect,
+                         lambda: frames.get(1 / self.FPS), self.fv.warm_up) for i in range(detection_stages)]
+        stages += [Stage("control", control, next_tick)]
+        display = Stage("display", self.display, lambda: images.get(0) if (show or debug) else None)
+        self.start_display(show or debug)
+        for stage in stages:
+            stage.start()
+
+        """Main loop"""
+        last_report = perf_counter()
+        while not self.should_stop:
+            display.run_step()
+            with METRICS.timer("key_wait"):
+                key = self.read_key()
+
+            """Keyboard commands getting"""
+            self.check_key(key)
+
+            if debug and perf_counter() - last_report > self.STATS_PERIOD:
+                last_report = perf_counter()
+                print(format_stats(stages + [display]))
+                print("Commands:", self.executor.stats())
+                print("RC:", self.rc_scheduler.stats())
+                print("Settle:", self.settle_metrics.summary())
+                if self.predictor is not None:
+                    print("Prediction:", self.predictor.stats())
+
+        for stage in stages:
+            stage.stop()
+        print(format_stats(stages + [display]))
+        print("Settle:", self.settle_metrics.summary())
+        print("Startup:", self.startup_stats())
+        self.executor.stop()
+        self.rc_scheduler.stop()
+        self.stop_display()
+        if self.recorder is not None:
+            self.recorder.stop()
+        self.tello.end()
+
+    def start_display(self, show):
+        """Shows the video with HUD if SHOW, otherwise the static picture is shown once.
+        In the headless mode the video goes to the MJPEG preview and there is no picture"""
+        self.hud = HUD(self.fv) if show else None
+        if self.headless:
+            if show:
+                self.preview = MJPEGServer(self.preview_address).start()
+                print("Preview at", self.preview.url())
+        else:
+            if not self.window:
+                namedWindow("drone")
+                self.window = True
+            if not show:
+                imshow("drone", self.picture())
+
+    def picture(self):
+        """Static picture shown instead of the video, loaded on first use"""
+        if self.paper is None:
+            self.paper = imread("./resources/Tello.png")
+        return self.paper
+
+    def stop_display(self):
+        if self.preview is not None:
+            self.preview.stop()
+            self.preview = None
+        if self.headless:
+            self.key_source.stop()
+
+    def read_key(self):
+        """Returns: the pressed key code or 0xff, waits up to 5 ms"""
+        if self.headless:
+            return self.key_source.get(0.005)
+        return waitKey(5) & 0xff
+
+    def display(self, item):
+        """Arguments: item: (frame, analysed: the frame went through FaceVector, face, directions vector)"""
+        frame, analysed, face, vec = item
+        if analysed:
+            frame = self.hud.render(frame, face, vec)
+        if self.preview is not None:
+            self.preview.publish(frame)
+        else:
+            imshow("drone", frame)
+
+    def record_frame(self, seq, timestamp, face, vec):
+        """Adds the frame analysis, the current RC setpoint and telemetry to the flight recording"""
+        if self.recorder is None:
+            return
+        setpoint = None
+        if self.send_rc_control:
+            setpoint = (self.left_right_velocity, self.for_back_velocity, self.up_down_velocity, self.yaw_velocity)
+        self.recorder.log_frame(seq, timestamp, face, vec, setpoint, self.tello.cached_state())
+
+    def predicted_vectors(self):
+        """Returns: directions vector and pixel vector to the face position predicted for now or (None, None)"""
+        face = self.predictor.predict(time())
+        if face is None:
+            return None, None
+        return self.fv.direction_vector_from_face(face), self.fv.pixel_vector_3d(face)
+
+    def drive(self, vec, pixel_vector=None, seq=None):
+        """Driving block. Arguments: vec: directions vector, pixel_vector: (dx, dy, square_ratio) for PID control,
+        seq: seq of the frame the vectors come from, if known"""
+        print(vec if self.control_mode == "discrete" else pixel_vector)
+        now = perf_counter()
+        self.settle_metrics.update(pixel_vector, now)
+
+        """Setting velocities with the controller"""
+        (self.left_right_velocity, self.for_back_velocity,
+         self.up_down_velocity, self.yaw_velocity) = self.controller.update(vec, pixel_vector, now)
+        """Send move commands"""
+        self.update()
+        self.hooks.emit("command_sent", seq=seq, velocities=(self.left_right_velocity, self.for_back_velocity,
+                                                             self.up_down_velocity, self.yaw_velocity))
+
     def update(self):
-        """ Update routine. Send velocities to Tello."""
+        """ Update routine. Velocities are sent to Tello by the RC scheduler."""
         if self.send_rc_control:
-            self.tello.move_with_velocities(self.left_right_velocity, self.for_back_velocity,
-                                            self.up_down_velocity, self.yaw_velocity)
+            self.rc_scheduler.set_setpoint(self.left_right_velocity, self.for_back_velocity,
+                                           self.up_down_velocity, self.yaw_velocity)
 
     def check_key(self, key):
         """
@@ -111,50 +411,146 @@ class FaceTracker:
             - I / K : Forward / Backward.
             - J / L : Left / Right.
             - SPACE : Start / Stop face tracking.
+            - P : Profile for ProfileCapture.DURATION seconds.
             - Q : Quit.
         """
 
         if key == ord('q'):  # stop
             self.should_stop = True
+        elif key == ord('p'):  # profile
+            if self.profile_capture.start():
+                print("Profiling for", self.profile_capture.duration, "s")
         elif key == ord('t'):  # takeoff
             print("Flying")
-            self.tello.takeoff()
-            self.send_rc_control = True
+            landings = self.landings
+            self.executor.submit("takeoff", callback=lambda result: self.on_takeoff(result, landings))
         elif key == ord('g'):  # land
             print("Landing")
-            self.tello.land()
-            self.send_rc_control = False
+            with self.flight_lock:
+                self.landings += 1
+                self.send_rc_control = False
+                self.rc_scheduler.disable()
+            self.executor.submit_priority("land")
         elif key == ord('i'):  # forward
-            self.tello.forward(50)
+            self.executor.submit("forward", 50)
         elif key == ord('k'):  # backward
-            self.tello.back(50)
+            self.executor.submit("back", 50)
         elif key == ord('j'):  # left
-            self.tello.left(50)
+            self.executor.submit("left", 50)
         elif key == ord('l'):  # right
-            self.tello.right(50)
+            self.executor.submit("right", 50)
         elif key == ord('w'):  # up
-            self.tello.up(50)
+            self.executor.submit("up", 50)
         elif key == ord('s'):  # down
-            self.tello.down(50)
+            self.executor.submit("down", 50)
         elif key == ord('a'):  # cw
-            self.tello.rotate_cw(30)
+            self.executor.submit("cw", 30)
         elif key == ord('d'):  # ccw
-            self.tello.rotate_ccw(30)
+            self.executor.submit("ccw", 30)
         elif key == ord(' '):  # change mode
             self.change_mode()
 
+    def on_takeoff(self, result, landings):
+        """RC is enabled only after a successful takeoff with no land issued since it was submitted"""
+        with self.flight_lock:
+            if result is True and landings == self.landings:
+                self.send_rc_control = True
+                self.rc_scheduler.enable()
+
     """Realise mode changing event"""
     def change_mode(self):
+        self.executor.cancel_pending()
         if self.mode == "tracking":
             self.mode = "keyboard"
+            self.rc_scheduler.set_setpoint(0, 0, 0, 0)
             self.tello.stop()
         elif self.mode == "keyboard":
             self.mode = "tracking"
 
 
 def main():
-    tracker = FaceTracker(480, 640)
-    tracker.run()  # todo: try to run without showing
+    import sys
+    from face_detector import DETECTORS, create_detector, select_detector
+    detector_backend = "haar"
+    for arg in sys.argv:
+        if arg.startswith("--detector="):
+            detector_backend = arg[len("--detector="):]
+    detector = None
+    if "--processes" in sys.argv:
+        from process_detector import ProcessFaceDetector
+        if detector_backend not in ("haar", "lbp"):
+            raise ValueError("Detection processes work with the cascade detectors only: --detector=haar or lbp")
+        detector = ProcessFaceDetector((480, 640, 3), cascade_path=DETECTORS[detector_backend].default_cascade_path())
+    elif detector_backend != "auto":
+        detector = create_detector(detector_backend)
+    tracking_mode = "full"
+    for mode in ("roi", "hybrid"):
+        if "--" + mode in sys.argv:
+            tracking_mode = mode
+    profile = None
+    for arg in sys.argv:
+        if arg.startswith("--profile="):
+            profile = arg[len("--profile="):]
+    host = Tello.HOST
+    for arg in sys.argv:
+        if arg.startswith("--host="):
+            host = arg[len("--host="):]
+    control_mode = "pid" if "--pid" in sys.argv else "discrete"
+    key_source = None
+    preview_address = None
+    for arg in sys.argv:
+        if arg.startswith("--keys-port="):
+            from key_source import SocketKeySource
+            key_source = SocketKeySource(('127.0.0.1', int(arg[len("--keys-port="):])))
+        if arg.startswith("--preview-port="):
+            preview_address = ('127.0.0.1', int(arg[len("--preview-port="):]))
+    recorder = None
+    tello_video_address = Tello.VIDEO_ADDRESS
+    for arg in sys.argv:
+        if arg.startswith("--record="):
+            from flight_recorder import FlightRecorder
+            recorder = FlightRecorder(arg[len("--record="):]).start()
+            tello_video_address = ('0.0.0.0', FlightRecorder.RELAY_ADDRESS[1])
+    video_backend = "opencv"
+    for arg in sys.argv:
+        if arg.startswith("--video="):
+            video_backend = arg[len("--video="):]
+    tello = Tello(host, video_address=tello_video_address, video_backend=video_backend)
+    tracker = FaceTracker(480, 640, detector, tracking_mode, profile, tello,
+                          control_mode, "--predict" in sys.argv, "--headless" in sys.argv, key_source,
+                          preview_address, recorder)
+    if detector_backend == "auto" and detector is None:
+        tracker.fv.detector, results = select_detector(FaceTracker.FPS, profile=tracker.fv.profile)
+        print("Detectors:", results)
+        print("Selected detector:", tracker.fv.detector.NAME)
+    metrics_server = None
+    for arg in sys.argv:
+        if arg == "--metrics" or arg.startswith("--metrics="):
+            from metrics import MetricsServer
+            port = int(arg[len("--metrics="):]) if "=" in arg else MetricsServer.ADDRESS[1]
+            snapshot_path = None
+            for other in sys.argv:
+                if other.startswith("--metrics-json="):
+                    snapshot_path = other[len("--metrics-json="):]
+            METRICS.enable()
+            metrics_server = MetricsServer(METRICS, ('127.0.0.1', port), snapshot_path).start()
+            print(f"Metrics at http://127.0.0.1:{port}/metrics")
+    profile_control = None
+    for arg in sys.argv:
+        if arg.startswith("--profile-port="):
+            from profiler import ProfileControl
+            profile_control = ProfileControl(tracker.profile_capture,
+                                             ('127.0.0.1', int(arg[len("--profile-port="):]))).start()
+    show = "--show" in sys.argv
+    if "--pipelined" in sys.argv:
+        tracker.run_pipelined(show, detection_stages=getattr(tracker.fv.detector, "workers_number", 1))
+    else:
+        tracker.run(show)
+    tracker.fv.detector.close()
+    if metrics_server is not None:
+        metrics_server.stop()
+    if profile_control is not None:
+        profile_control.stop()
 
 
 if __name__ == '__main__':
@@ -1,12 +1,49 @@
-from cv2 import CascadeClassifier, cvtColor, rectangle, circle, arrowedLine, putText, \
-    resize, COLOR_BGR2GRAY, data, line, FONT_HERSHEY_COMPLEX
+from math import ceil
+from time import perf_counter
+import numpy as np
+from cv2 import rectangle, circle, arrowedLine, putText, resize, line, cvtColor, FONT_HERSHEY_COMPLEX, COLOR_BGR2GRAY
+from face_detector import FaceDetector
+from detection_profile import DetectionProfile, default_profiles
+from template_tracker import TemplateTracker
 
 
 class FaceVector:
-    def __init__(self, height=480, width=640):
-        """Arguments: returning image size"""
+    """Constants"""
+    MAX_MISSES = 5  # ROI searches without a face before full frame search
+    ROI_EXPANSION = 0.75  # ROI margin around the last face box in face sizes
+    SIZE_TOLERANCE = 1.5  # ROI search face sizes from last size / tolerance to last size * tolerance
+    MAX_DETECTION_INTERVAL = 10  # the biggest number of frames between detections in hybrid mode
+    COST_SMOOTHING = 0.2  # weight of the last measurement in detection and tracking cost averages
+
+    def __init__(self, height=480, width=640, detector=None, tracking_mode="full", target_fps=20, profile=None):
+        """Arguments: returning image size, detector: FaceDetector (or another face_detector backend)
+        shared between several FaceVectors (optional),
+        tracking_mode: "full" - search the whole frame every time,
+                       "roi" - search near the last face and fall back to the whole frame after MAX_MISSES misses,
+                       "hybrid" - detect every detection_interval frames, track the face template in between,
+        target_fps: frame rate used to tune detection_interval in hybrid mode,
+        profile: DetectionProfile or name of one of default_profiles for full frame search, "full" by default"""
         self.previous_faces = None
         self.face = None
+        self.tracked_face = None
+        self.misses = 0
+        self.detector = detector if detector is not None else FaceDetector()
+        self.tracking_mode = tracking_mode
+
+        """Hybrid mode"""
+        self.target_fps = target_fps
+        self.tracker = TemplateTracker()
+        self.detection_interval = 1
+        self.frames_since_detection = 0
+        self.detection_cost = None
+        self.tracking_cost = None
+
+        """Statistics"""
+        self.full_searches = 0
+        self.roi_searches = 0
+        self.detected_frames = 0
+        self.tracked_frames = 0
+        self.track_losses = 0
 
         self.height = height
         self.width = width
@@ -30,6 +67,20 @@ class FaceVector:
         self.right_lower_corner = (int(self.width * (0.5 + self.target_face_region_ratio)),
                                    int(self.height * (0.5 + self.target_face_region_ratio)))
 
+        self.profiles = default_profiles(self.width, self.height, self.target_square_ratio, self.delta_square_ratio)
+        self.profile = None
+        self.set_profile(profile)
+
+    def set_profile(self, profile):
+        """Arguments: profile: DetectionProfile, name of one of default_profiles or None for "full" """
+        if profile is None:
+            profile = "full"
+        if not isinstance(profile, DetectionProfile):
+            if profile not in self.profiles:
+                raise ValueError(f"Unknown detection profile {profile}, known: {', '.join(self.profiles)}")
+            profile = self.profiles[profile]
+        self.profile = profile
+
     @staticmethod
     def sign(n):
         if n > 0:
@@ -41,12 +92,125 @@ class FaceVector:
 
     """Face detection"""
 
-    @staticmethod
-    def face_detection(image):
-        face_cascade = CascadeClassifier(data.haarcascades + 'haarcascade_frontalface_default.xml')
+    def face_detection(self, image):
+        return self.profile.detect(self.detector, image)
+
+    def warm_up(self):
+        """Runs the detector once on a blank frame of the working size, so the classifier of the calling thread
+        is loaded and OpenCV buffers are allocated before the first real frame. Tracking state is not changed.
+        Returns: seconds it took"""
+        start = perf_counter()
+        self.face_detection(np.zeros((self.height, self.width, 3), np.uint8))
+        return perf_counter() - start
+
+    def roi_face_detection(self, image, face):
+        """Searches faces of size close to FACE size in the expanded window around it.
+        Returns: faces in full image coordinates"""
+        (x, y, w, h) = face
+        margin_x, margin_y = int(w * self.ROI_EXPANSION), int(h * self.ROI_EXPANSION)
+        x0, y0 = max(0, x - margin_x), max(0, y - margin_y)
+        x1, y1 = min(image.shape[1], x + w + margin_x), min(image.shape[0], y + h + margin_y)
+        min_side = int(min(w, h) / self.SIZE_TOLERANCE)
+        max_side = int(max(w, h) * self.SIZE_TOLERANCE)
+        faces = self.detector.detect(image[y0:y1, x0:x1], self.profile.scale_factor,
+                                     (min_side, min_side), (max_side, max_side))
+        return [(int(fx) + x0, int(fy) + y0, int(fw), int(fh)) for (fx, fy, fw, fh) in faces]
+
+    def closest_face(self, faces, face):
+        """Returns the face from FACES with center closest to the center of FACE"""
+        (cx, cy) = self.face_center(face)
+        return min(faces, key=lambda f: (self.face_center(f)[0] - cx) ** 2 + (self.face_center(f)[1] - cy) ** 2)
+
+    def find_face(self, image):
+        """Returns face (x, y, w, h) to track on the resized image or None. The result is kept in tracked_face"""
+        if self.tracking_mode == "roi" and self.face is not None:
+            face = self.roi_face_search(image)
+        elif self.tracking_mode == "hybrid":
+            face = self.hybrid_face_search(image)
+        else:
+            face = self.full_face_search(image)
+        self.tracked_face = face
+        return face
+
+    def full_face_search(self, image):
+        self.full_searches += 1
+        faces = self.face_detection(image)
+        self.previous_faces = faces
+        if faces is not None and len(faces) > 0:
+            self.misses = 0
+            face = tuple(int(v) for v in faces[0])
+            self.face = face
+            return face
+        self.face = None
+        return None
+
+    def roi_face_search(self, image):
+        self.roi_searches += 1
+        faces = self.roi_face_detection(image, self.face)
+        if len(faces) > 0:
+            self.misses = 0
+            self.previous_faces = faces
+            face = self.closest_face(faces, self.face)
+            self.face = face
+            return face
+        self.misses += 1
+        if self.misses >= self.MAX_MISSES:
+            self.face = None
+        return None
+
+    def hybrid_face_search(self, image):
+        """Full detection every detection_interval frames or on loss of track, template tracking in between"""
         img_gray = cvtColor(image, COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(image=img_gray)
-        return faces
+        if self.face is not None and self.frames_since_detection < self.detection_interval:
+            start = perf_counter()
+            face = self.tracker.update(img_gray)
+            self.tracking_cost = self.smooth(self.tracking_cost, perf_counter() - start)
+            if face is not None:
+                self.frames_since_detection += 1
+                self.tracked_frames += 1
+                self.face = face
+                return face
+            self.track_losses += 1
+
+        start = perf_counter()
+        face = self.full_face_search(image)
+        self.detection_cost = self.smooth(self.detection_cost, perf_counter() - start)
+        self.detected_frames += 1
+        self.frames_since_detection = 1
+        if face is not None:
+            self.tracker.init(img_gray, face)
+        else:
+            self.tracker.reset()
+        self.tune_detection_interval()
+        return face
+
+    def smooth(self, average, value):
+        if average is None:
+            return value
+        return average + self.COST_SMOOTHING * (value - average)
+
+    def tune_detection_interval(self):
+        """Chooses the smallest detection interval K keeping the mean frame cost
+        (detection + (K - 1) * tracking) / K inside the 1 / target_fps budget"""
+        budget = 1 / self.target_fps
+        detection_cost = self.detection_cost or 0.0
+        tracking_cost = self.tracking_cost or 0.0
+        if detection_cost <= budget:
+            self.detection_interval = 1
+        elif tracking_cost >= budget:
+            self.detection_interval = self.MAX_DETECTION_INTERVAL
+        else:
+            interval = ceil((detection_cost - tracking_cost) / (budget - tracking_cost))
+            self.detection_interval = max(1, min(self.MAX_DETECTION_INTERVAL, interval))
+
+    def stats(self):
+        """Detection statistics"""
+        return {"full_searches": self.full_searches,
+                "roi_searches": self.roi_searches,
+                "detected_frames": self.detected_frames,
+                "tracked_frames": self.tracked_frames,
+                "track_losses": self.track_losses,
+                "detection_interval": self.detection_interval}
 
     @staticmethod
     def face_center(face):
@@ -105,58 +269,60 @@ class FaceVector:
                     FONT_HERSHEY_COMPLEX, 1, (255, 255, 255))
         return image
 
+    def pixel_vector_3d(self, face):
+        """Returns (number of pixels to which the center of the face is to the left of the center of the image,
+                    number of pixels to which the center of the face is upper than the center of the image,
+                    face to frame square ratio) or None"""
+        if face is None:
+            return None
+        face_center = self.face_center(face)
+        return (self.img_center[0] - face_center[0], self.img_center[1] - face_center[1],
+                self.face_square(face) / self.frame_square)
+
+    def direction_vector_from_face(self, face):
+        """Returns directions vector to the FACE (x, y, w, h)"""
+        face_square = self.face_square(face)
+        square_ratio = face_square / self.frame_square
+        face_center = self.face_center(face)
+        result_vector = ((self.img_center[0] - face_center[0]), (self.img_center[1] - face_center[1]))
+
+        direction_vector = [self.sign(int(result_vector[0] / (self.width * self.target_face_region_ratio))),
+                            self.sign(int(result_vector[1] / (self.height * self.target_face_region_ratio)))]
+
+        if square_ratio < self.target_square_ratio - self.delta_square_ratio:
+            direction_vector.append(1)
+        elif square_ratio > self.target_square_ratio + self.delta_square_ratio:
+            direction_vector.append(-1)
+        else:
+            direction_vector.append(0)
+        return direction_vector
+
     def direction_vector_3d(self, image):
+        return self.direction_vector_3d_with_face(image)[0]
 
+    def direction_vector_3d_with_face(self, image):
+        """Returns: (directions vector or None, face (x, y, w, h) on the resized image or None).
+        Callers sharing the FaceVector between threads use this face instead of tracked_face,
+        which another thread may overwrite meanwhile"""
         image = resize(image, (self.width, self.height))
 
-        faces = self.face_detection(image)
+        face = self.find_face(image)
 
-        if faces is not None and len(faces) > 0:
-            face = faces[0]
-            face_square = self.face_square(face)
-            square_ratio = face_square / self.frame_square
-            face_center = self.face_center(face)
-            result_vector = ((self.img_center[0] - face_center[0]), (self.img_center[1] - face_center[1]))
-
-            direction_vector = [self.sign(int(result_vector[0] / (self.width * self.target_face_region_ratio))),
-                                self.sign(int(result_vector[1] / (self.height * self.target_face_region_ratio)))]
-
-            if square_ratio < self.target_square_ratio - self.delta_square_ratio:
-                direction_vector.append(1)
-            elif square_ratio > self.target_square_ratio + self.delta_square_ratio:
-                direction_vector.append(-1)
-            else:
-                direction_vector.append(0)
-            return direction_vector
+        if face is not None:
+            return self.direction_vector_from_face(face), face
 
         else:
-            return None
+            return None, None
 
     def direction_vector_3d_with_returning_image(self, image):
 
         image = resize(image, (self.width, self.height))
 
-        faces = self.face_detection(image)
+        face = self.find_face(image)
         image = self.frame_processing(image)
 
-        if faces is not None and len(faces) > 0:
-            face = faces[0]
-
-            face_square = self.face_square(face)
-            square_ratio = face_square / self.frame_square
-            face_center = self.face_center(face)
-            result_vector = ((self.img_center[0] - face_center[0]), (self.img_center[1] - face_center[1]))
-
-            direction_vector = [self.sign(int(result_vector[0] / (self.width * self.target_face_region_ratio))),
-                                self.sign(int(result_vector[1] / (self.height * self.target_face_region_ratio)))]
-
-            if square_ratio < self.target_square_ratio - self.delta_square_ratio:
-                direction_vector.append(1)
-            elif square_ratio > self.target_square_ratio + self.delta_square_ratio:
-                direction_vector.append(-1)
-            else:
-                direction_vector.append(0)
-
+        if face is not None:
+            direction_vector = self.direction_vector_from_face(face)
             image = self.face_definition(image, face)
             return direction_vector, image
 
@@ -226,7 +392,7 @@ def main():
     capture = VideoCapture(0)
     resolution = (960, 720)
 
-    fv = FaceVector(resolution[1], resolution[0])
+    fv = FaceVector(resolution[1], resolution[0], tracking_mode="roi")
     while True:
         r, i = capture.read()
         if r:
@@ -234,7 +400,7 @@ def main():
             vec, image = fv.direction_vector_3d_with_returning_image(i)
             image = fv.text_addition(image, vec)
             imshow("", image)
-            print(vec)
+            print(vec, f"{fv.detector.last_detection_time * 1000:.1f} ms")
         if waitKey(1) & 0xFF == ord('q'):
             break
 
@@ -0,0 +1,158 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+import numpy as np
+from cv2 import VideoCapture, imread, resize, CAP_PROP_FPS, CAP_PROP_POS_MSEC
+from face_vector import FaceVector
+
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+
+
+def iterate_frames(source, fps=30.0):
+    """Yields (frame index, timestamp in seconds, BGR frame).
+    Arguments: source: video file path, directory with frames or (N, H, W, 3) NumPy stack,
+    fps: frame rate for timestamps of directories and stacks"""
+    if isinstance(source, np.ndarray):
+        if source.ndim != 4 or source.shape[3] != 3:
+            raise ValueError(f"Frame stack must have (N, H, W, 3) shape, got {source.shape}")
+        for index, frame in enumerate(source):
+            yield index, index / fps, frame
+    elif os.path.isdir(source):
+        names = sorted(name for name in os.listdir(source) if name.lower().endswith(IMAGE_EXTENSIONS))
+        for index, name in enumerate(names):
+            frame = imread(os.path.join(source, name))
+            if frame is not None:
+                yield index, index / fps, frame
+    else:
+        capture = VideoCapture(source)
+        if not capture.isOpened():
+            raise IOError(f"Can not open video {source}")
+        index = 0
+        try:
+            while True:
+                r, frame = capture.read()
+                if not r:
+                    break
+                yield index, capture.get(CAP_PROP_POS_MSEC) / 1000, frame
+                index += 1
+        finally:
+            capture.release()
+
+
+def source_fps(source, default=30.0):
+    """Frame rate of the video file, DEFAULT for directories and stacks"""
+    if isinstance(source, str) and os.path.isfile(source):
+        capture = VideoCapture(source)
+        fps = capture.get(CAP_PROP_FPS)
+        capture.release()
+        if fps > 0:
+            return fps
+    return default
+
+
+class BatchFaceVector:
+    """Offline FaceVector over video files, frame directories and frame stacks.
+    Frames are processed by a thread pool, results are returned as columnar NumPy arrays"""
+
+    """Constants"""
+    IN_FLIGHT_PER_WORKER = 4  # frames queued per worker, bounds memory for long videos
+
+    def __init__(self, height=480, width=640, workers=None, detector=None, profile=None):
+        """Arguments: FaceVector image size, workers: thread pool size (cpu count by default),
+        detector: FaceDetector or ProcessFaceDetector, profile: FaceVector detection profile.
+        Tuned parameters (target_face_region_ratio, target_square_ratio, ...) can be set on self.fv"""
+        self.fv = FaceVector(height, width, detector, profile=profile)
+        self.workers = workers if workers is not None else max(1, os.cpu_count() or 1)
+        self.elapsed = 0.0
+        self.frames = 0
+
+    def process_frame(self, frame):
+        """Returns: (face box or None, directions vector or None, square ratio or None)"""
+        image = resize(frame, (self.fv.width, self.fv.height))
+        faces = self.fv.face_detection(image)
+        if faces is None or len(faces) == 0:
+            return None, None, None
+        face = tuple(int(v) for v in faces[0])
+        return face, self.fv.direction_vector_from_face(face), self.fv.face_square(face) / self.fv.frame_square
+
+    def process(self, source, output=None, fps=30.0):
+        """Arguments: source: video file path, directory with frames or (N, H, W, 3) NumPy stack,
+        output: optional .npz file path to save results to
+        Returns: dict of columns: frame, timestamp, found, box (N, 4), direction (N, 3), square_ratio"""
+        frame_indices, timestamps, results = [], [], []
+        start = perf_counter()
+        with ThreadPoolExecutor(self.workers) as executor:
+            in_flight = deque()
+            for index, timestamp, frame in iterate_frames(source, fps):
+                frame_indices.append(index)
+                timestamps.append(timestamp)
+                in_flight.append(executor.submit(self.process_frame, frame))
+                if len(in_flight) >= self.workers * self.IN_FLIGHT_PER_WORKER:
+                    results.append(in_flight.popleft().result())
+            while in_flight:
+                results.append(in_flight.popleft().result())
+        self.elapsed = perf_counter() - start
+        self.frames = len(results)
+
+        columns = self.to_columns(frame_indices, timestamps, results)
+        if output is not None:
+            self.save(output, columns)
+        return columns
+
+    def to_columns(self, frame_indices, timestamps, results):
+        n = len(results)
+        columns = {"frame": np.asarray(frame_indices, dtype=np.int64),
+                   "timestamp": np.asarray(timestamps, dtype=np.float64),
+                   "found": np.zeros(n, dtype=bool),
+                   "box": np.full((n, 4), -1, dtype=np.int32),
+                   "direction": np.zeros((n, 3), dtype=np.int8),
+                   "square_ratio": np.full(n, np.nan, dtype=np.float32)}
+        for i, (face, direction, square_ratio) in enumerate(results):
+            if face is not None:
+                columns["found"][i] = True
+                columns["box"][i] = face
+                columns["direction"][i] = direction
+                columns["square_ratio"][i] = square_ratio
+        return columns
+
+    def save(self, path, columns):
+        """Saves columns and FaceVector parameters into a compressed .npz file"""
+        np.savez_compressed(path,
+                            width=self.fv.width,
+                            height=self.fv.height,
+                            target_face_region_ratio=self.fv.target_face_region_ratio,
+                            target_square_ratio=self.fv.target_square_ratio,
+                            delta_square_ratio=self.fv.delta_square_ratio,
+                            **columns)
+
+    def fps(self):
+        """Processing speed of the last process call (frames/s)"""
+        return self.frames / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def load_results(path):
+    """Returns: dict of arrays saved by BatchFaceVector.save"""
+    with np.load(path) as results:
+        return {name: results[name] for name in results.files}
+
+
+def main():
+    import sys
+    if len(sys.argv) < 2:
+        print("Usage: face_vector_batch.py <video file | frames directory | stack.npy> [output.npz]")
+        return
+    source = sys.argv[1]
+    output = sys.argv[2] if len(sys.argv) > 2 else None
+    if source.endswith('.npy'):
+        source = np.load(source, mmap_mode='r')
+    batch = BatchFaceVector(720, 960)
+    columns = batch.process(source, output)
+    fps = source_fps(source)
+    print(f"{batch.frames} frames in {batch.elapsed:.1f} s: {batch.fps():.1f} fps, "
+          f"{batch.fps() / fps:.2f}x real time, faces found on {int(columns['found'].sum())} frames")
+
+
+if __name__ == "__main__":
+    main()
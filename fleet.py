@@ -0,0 +1,376 @@
+import os
+import selectors
+import socket
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Thread, Lock
+from time import perf_counter, time
+from async_udp_client import AsyncUDPClient
+from face_detector import FaceDetector
+from face_vector import FaceVector
+from tello_state import TelloStateListener
+from video_ingest import NALIngest
+
+
+class FleetDrone:
+    """One drone of the fleet: its own command, state and video ports, video reassembly and decoding,
+    state ring buffer, FaceVector and statistics. Sockets are served by the Fleet event loop.
+    Video is reassembled and decoded by NALIngest, so PyAV is required"""
+
+    """Constants"""
+    BUFFER_SIZE = 2048
+
+    def __init__(self, name, host, command_port=8889, state_port=8890, video_port=11111, fv=None):
+        """Arguments: name, host, command_port: drone address, state_port, video_port: local ports the drone
+        is told to send state and video to, fv: FaceVector of this drone"""
+        self.name = name
+        self.command_address = (host, command_port)
+        self.state_port = state_port
+        self.video_port = video_port
+        self.fv = fv
+
+        self.command_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.command_socket.bind(('0.0.0.0', 0))
+        self.command_socket.setblocking(False)
+        self.state_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.state_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.state_socket.bind(('0.0.0.0', state_port))
+        self.state_socket.setblocking(False)
+        self.state = TelloStateListener(('0.0.0.0', state_port))  # used as the ring buffer only
+        self.video = NALIngest(('0.0.0.0', video_port))
+        self.video.open()
+        self.video.socket.setblocking(False)
+
+        self.lock = Lock()
+        self.pending = deque()  # (command, future)
+        self.in_flight = None  # (command, future, deadline)
+        self.last_timed_out = None
+        self.quarantine_until = 0.0
+        self.detecting = False
+        self.next_frame = None
+        self.vec = None
+        self.vec_time = None
+
+        """Statistics"""
+        self.started = perf_counter()
+        self.frames = 0
+        self.video_bytes = 0
+        self.detections = 0
+        self.skipped_frames = 0  # frames replaced by a newer one while detection was busy
+        self.detection_time = 0.0
+        self.detection_errors = 0
+        self.commands = 0
+        self.timeouts = 0
+        self.late_responses = 0
+        self.mismatched_responses = 0
+
+    def close(self):
+        self.command_socket.close()
+        self.state_socket.close()
+        self.video.release()
+
+    def stats(self):
+        elapsed = max(perf_counter() - self.started, 1e-9)
+        return {"fps": self.frames / elapsed,
+                "detections_per_s": self.detections / elapsed,
+                "video_kbps": self.video_bytes * 8 / 1000 / elapsed,
+                "state_packets": self.state.packets,
+                "skipped_frames": self.skipped_frames,
+                "mean_detection_ms": self.detection_time / self.detections * 1000 if self.detections else None,
+                "detection_errors": self.detection_errors,
+                "commands": self.commands,
+                "timeouts": self.timeouts,
+                "late_responses": self.late_responses,
+                "mismatched_responses": self.mismatched_responses,
+                "corrupted": self.video.stats.corrupted,
+                "dropped": self.video.stats.dropped}
+
+
+class Fleet:
+    """Runs several drones from one process. All command, state and video sockets are served by one
+    selectors event loop thread, face detection of all streams shares one thread pool and one detector.
+    Every drone has one command in flight at a time, the newest frame waits while its detection is busy.
+    Responses are matched as in AsyncUDPClient: by response kind, and after a timeout the next different command
+    of the drone waits out the quarantine of the timed out one, so its late response is not taken for another"""
+
+    """Constants"""
+    TIMEOUT = 7  # command response timeout, seconds
+    FLYING_TIMEOUT = 20  # response timeout of movements, answered only when the drone stops
+    SELECT_TIMEOUT = 0.05
+
+    def __init__(self, drones, detection_workers=None, on_vector=None):
+        """Arguments: drones: FleetDrone list, detection_workers: detection threads (cpu count by default),
+        on_vector: callback(drone, vec) called from a detection thread after every detection"""
+        self.drones = drones
+        self.on_vector = on_vector
+        self.pool = ThreadPoolExecutor(detection_workers or os.cpu_count())
+        self.selector = selectors.DefaultSelector()
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.wakeup_reader.setblocking(False)
+        self.selector.register(self.wakeup_reader, selectors.EVENT_READ, (None, "wakeup"))
+        for drone in drones:
+            self.selector.register(drone.command_socket, selectors.EVENT_READ, (drone, "command"))
+            self.selector.register(drone.state_socket, selectors.EVENT_READ, (drone, "state"))
+            self.selector.register(drone.video.socket, selectors.EVENT_READ, (drone, "video"))
+        self.buffer = bytearray(FleetDrone.BUFFER_SIZE)
+        self.view = memoryview(self.buffer)
+        self.stopped = False
+        self.loop_thread = Thread(target=self.loop, daemon=True)
+
+        """Statistics"""
+        self.started = None
+        self.busy_time = 0.0
+        self.events = 0
+
+    def start(self):
+        self.started = perf_counter()
+        self.loop_thread.start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+        self.wakeup()
+        self.loop_thread.join(1)
+        self.pool.shutdown(wait=True)
+        for drone in self.drones:
+            drone.close()
+        self.selector.close()
+        self.wakeup_reader.close()
+        self.wakeup_writer.close()
+
+    def wakeup(self):
+        try:
+            self.wakeup_writer.send(b"\0")
+        except OSError:
+            pass
+
+    """Commands"""
+
+    def send(self, drone, command):
+        """Queues COMMAND to DRONE. Returns: Future with the response text or None on timeout"""
+        future = Future()
+        with drone.lock:
+            drone.pending.append((command, future))
+        self.wakeup()
+        return future
+
+    def send_all(self, command, timeout=None):
+        """Sends COMMAND to every drone at once. Returns: dict of drone name: response or None"""
+        futures = {drone.name: self.send(drone, command) for drone in self.drones}
+        return {name: future.result(timeout) for name, future in futures.items()}
+
+    def send_rc(self, drone, left_right_velocity, forward_backward_velocity, up_down_velocity, yaw_velocity):
+        """RC commands get no response, they are sent right away"""
+        command = f"rc {left_right_velocity} {forward_backward_velocity} {up_down_velocity} {yaw_velocity}"
+        try:
+            drone.command_socket.sendto(command.encode("utf-8"), drone.command_address)
+        except OSError:
+            pass
+
+    def bring_up(self):
+        """Command mode, state and video ports (SDK 2.0 "port" command) and video stream on every drone.
+        Returns: dict of drone name: True if all steps succeeded"""
+        results = {drone.name: True for drone in self.drones}
+        for step in ("command", "port", "streamon"):
+            futures = {}
+            for drone in self.drones:
+                if not results[drone.name]:
+                    continue
+                command = f"port {drone.state_port} {drone.video_port}" if step == "port" else step
+                futures[drone.name] = self.send(drone, command)
+            for name, future in futures.items():
+                results[name] = future.result() == "ok"
+        return results
+
+    @staticmethod
+    def is_long(command):
+        return command.split(" ", 1)[0] in AsyncUDPClient.LONG_COMMANDS
+
+    def deadline(self, command):
+        return self.FLYING_TIMEOUT if self.is_long(command) else self.TIMEOUT
+
+    def quarantine(self, command):
+        """Seconds a late response to the timed out COMMAND is expected in"""
+        return AsyncUDPClient.LONG_TIMEOUT if self.is_long(command) else AsyncUDPClient.LATE_WINDOW
+
+    def dispatch(self, drone, now):
+        """Sends the next queued command if nothing is in flight and it is out of quarantine,
+        times the in-flight one out"""
+        with drone.lock:
+            if drone.in_flight is not None and now > drone.in_flight[2]:
+                command, future, _ = drone.in_flight
+                drone.timeouts += 1
+                drone.last_timed_out = command
+                drone.quarantine_until = now + self.quarantine(command)
+                future.set_result(None)
+                drone.in_flight = None
+            if drone.in_flight is None and drone.pending:
+                if drone.pending[0][0] != drone.last_timed_out and now < drone.quarantine_until:
+                    return
+                command, future = drone.pending.popleft()
+                try:
+                    drone.command_socket.sendto(command.encode("utf-8"), drone.command_address)
+                except OSError:
+                    future.set_result(None)
+                    return
+                drone.commands += 1
+                drone.in_flight = (command, future, now + self.deadline(command))
+
+    def handle_command(self, drone):
+        while True:
+            try:
+                data = drone.command_socket.recv(FleetDrone.BUFFER_SIZE)
+            except (BlockingIOError, OSError):
+                return
+            response = data.decode("utf-8", errors="replace").rstrip("\r\n")
+            with drone.lock:
+                if drone.in_flight is None:
+                    drone.late_responses += 1
+                    continue
+                command, future, _ = drone.in_flight
+                if not AsyncUDPClient.matches(command, response):
+                    drone.mismatched_responses += 1
+                    continue
+                drone.in_flight = None
+                drone.last_timed_out = None
+            future.set_result(response)
+
+    """State and video"""
+
+    def handle_state(self, drone):
+        while True:
+            try:
+                size = drone.state_socket.recv_into(self.buffer)
+            except (BlockingIOError, OSError):
+                return
+            drone.state.packets += 1
+            drone.state.parse(self.view[:size], time())
+
+    def handle_video(self, drone):
+        while True:
+            try:
+                size = drone.video.socket.recv_into(self.buffer)
+            except (BlockingIOError, OSError):
+                return
+            drone.video_bytes += size
+            frame = drone.video.feed(bytes(self.view[:size]), perf_counter())
+            if frame is not None:
+                drone.frames += 1
+                self.submit_detection(drone, frame)
+
+    """Detection"""
+
+    def submit_detection(self, drone, frame):
+        with drone.lock:
+            if drone.detecting:
+                if drone.next_frame is not None:
+                    drone.skipped_frames += 1
+                drone.next_frame = frame
+                return
+            drone.detecting = True
+        self.pool.submit(self.detect, drone, frame)
+
+    def detect(self, drone, frame):
+        """Detection job. The newest frame that came meanwhile is queued behind the other drones' jobs.
+        A failed detection is counted and does not stop the detection of the drone"""
+        try:
+            start = perf_counter()
+            vec = drone.fv.direction_vector_3d(frame)
+            with drone.lock:
+                drone.detection_time += perf_counter() - start
+                drone.detections += 1
+                drone.vec, drone.vec_time = vec, perf_counter()
+            if self.on_vector is not None:
+                self.on_vector(drone, vec)
+        except Exception:  # nobody reads the result of the pool job
+            with drone.lock:
+                drone.detection_errors += 1
+        finally:
+            with drone.lock:
+                frame, drone.next_frame = drone.next_frame, None
+                drone.detecting = frame is not None and not self.stopped
+        if drone.detecting:
+            try:
+                self.pool.submit(self.detect, drone, frame)
+            except RuntimeError:  # the pool is shut down
+                drone.detecting = False
+
+    """Event loop"""
+
+    def loop(self):
+        handlers = {"command": self.handle_command, "state": self.handle_state, "video": self.handle_video}
+        while not self.stopped:
+            events = self.selector.select(self.SELECT_TIMEOUT)
+            start = perf_counter()
+            for key, _ in events:
+                drone, kind = key.data
+                if kind == "wakeup":
+                    try:
+                        self.wakeup_reader.recv(64)
+                    except BlockingIOError:
+                        pass
+                    continue
+                handlers[kind](drone)
+            for drone in self.drones:
+                self.dispatch(drone, start)
+            self.events += len(events)
+            self.busy_time += perf_counter() - start
+
+    """Statistics"""
+
+    def stats(self):
+        """Returns: per drone statistics and the aggregate ones. loop_utilisation near 1 means the event loop
+        is saturated, detection_backlog is the share of decoded frames that detection could not take"""
+        drones = {drone.name: drone.stats() for drone in self.drones}
+        elapsed = max(perf_counter() - self.started, 1e-9) if self.started is not None else 1e-9
+        frames = sum(drone.frames for drone in self.drones)
+        return {"drones": drones,
+                "total": {"drones": len(self.drones),
+                          "fps": sum(s["fps"] for s in drones.values()),
+                          "detections_per_s": sum(s["detections_per_s"] for s in drones.values()),
+                          "video_kbps": sum(s["video_kbps"] for s in drones.values()),
+                          "loop_utilisation": self.busy_time / elapsed,
+                          "detection_backlog": sum(d.skipped_frames for d in self.drones) / frames if frames else 0.0}}
+
+
+def main():
+    """python fleet.py [N] runs N simulated drones, python fleet.py --hosts=IP1,IP2 flies real ones"""
+    import sys
+    from time import sleep
+    from tello_simulator import TelloSimulator, SyntheticH264Source
+    hosts = None
+    count = 3
+    for arg in sys.argv[1:]:
+        if arg.startswith("--hosts="):
+            hosts = arg[len("--hosts="):].split(",")
+        elif arg.isdigit():
+            count = int(arg)
+    detector = FaceDetector()
+    simulators = []
+    drones = []
+    if hosts is None:
+        for i in range(count):
+            simulators.append(TelloSimulator(command_port=9000 + i, state_port=8890, video_port=11111,
+                                             video_source=SyntheticH264Source()).start())
+            drones.append(FleetDrone(f"sim{i}", "127.0.0.1", 9000 + i, 9100 + i, 9200 + i,
+                                     FaceVector(480, 640, detector)))
+    else:
+        for i, host in enumerate(hosts):
+            drones.append(FleetDrone(host, host, 8889, 9100 + i, 9200 + i, FaceVector(480, 640, detector)))
+    fleet = Fleet(drones).start()
+    print("Bring-up:", fleet.bring_up())
+    try:
+        sleep(10)
+        stats = fleet.stats()
+        for name, s in stats["drones"].items():
+            print(name, {k: round(v, 1) if isinstance(v, float) else v for k, v in s.items()})
+        print("total", {k: round(v, 3) if isinstance(v, float) else v for k, v in stats["total"].items()})
+    finally:
+        fleet.send_all("streamoff", 2)
+        fleet.stop()
+        for simulator in simulators:
+            simulator.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+import json
+import os
+import socket
+import struct
+from collections import deque
+from queue import Queue
+from threading import Thread, Lock
+from time import time
+import numpy as np
+
+
+"""Columnar side file: MAGIC, uint32 header length, JSON header {"fields": [[name, dtype], ...]},
+then blocks: uint32 number of rows followed by every column of the block"""
+
+MAGIC = b"TVCOL1\n"
+
+INDEX_DTYPE = np.dtype([("timestamp", np.float64), ("segment", np.uint16), ("offset", np.uint64),
+                        ("nal_type", np.uint8), ("frame", np.uint32)])
+
+FRAME_DTYPE = np.dtype([("seq", np.uint32), ("frame", np.int32), ("timestamp", np.float64), ("logged", np.float64),
+                        ("x", np.int16), ("y", np.int16), ("w", np.int16), ("h", np.int16),
+                        ("vx", np.int8), ("vy", np.int8), ("vz", np.int8),
+                        ("lr", np.int8), ("fb", np.int8), ("ud", np.int8), ("yaw_rc", np.int8),
+                        ("bat", np.int16), ("height", np.int32), ("tof", np.int32),
+                        ("pitch", np.int16), ("roll", np.int16), ("yaw", np.int16)])
+
+
+def write_header(file, dtype):
+    header = json.dumps({"fields": [[name, dtype[name].str] for name in dtype.names]}).encode("ascii")
+    file.write(MAGIC + struct.pack("<I", len(header)) + header)
+
+
+def write_block(file, records):
+    file.write(struct.pack("<I", len(records)))
+    for name in records.dtype.names:
+        file.write(np.ascontiguousarray(records[name]).tobytes())
+
+
+def read_columns(path):
+    """Returns: dict of column name: NumPy array with all rows of a columnar side file"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a columnar side file")
+    position = len(MAGIC)
+    (length,) = struct.unpack_from("<I", data, position)
+    position += 4
+    fields = [(name, np.dtype(dtype)) for name, dtype in json.loads(data[position:position + length])["fields"]]
+    position += length
+    blocks = {name: [] for name, _ in fields}
+    while position + 4 <= len(data):
+        (rows,) = struct.unpack_from("<I", data, position)
+        position += 4
+        for name, dtype in fields:
+            size = rows * dtype.itemsize
+            if position + size > len(data):  # truncated by a crash
+                return {name: np.concatenate(parts) if parts else np.zeros(0, dtype)
+                        for (name, parts), (_, dtype) in zip(blocks.items(), fields)}
+            blocks[name].append(np.frombuffer(data, dtype, rows, position))
+            position += size
+    return {name: np.concatenate(blocks[name]) if blocks[name] else np.zeros(0, dtype) for name, dtype in fields}
+
+
+class FlightRecorder:
+    """Tees the raw H.264 UDP packets of the drone into segmented .h264 files without decoding them
+    and relays every packet to a local port, where the video capture reads it.
+    An index (arrival time and file offset of every packet starting a NAL unit) and the per-frame side file
+    (face, directions vector, RC setpoint, telemetry by frame seq) are kept in columnar files.
+    The "frame" column of both files is the recorder's frame number, the join key of a side row and the video:
+    a side row gets the last frame completely received before the capture timestamp of the analysed frame.
+    Everything is written by one writer thread in batches. Memory is bounded by MAX_PENDING:
+    when the disk can not keep up, packets are not recorded (and counted) but still relayed"""
+
+    """Constants"""
+    LISTEN_ADDRESS = ('0.0.0.0', 11111)
+    RELAY_ADDRESS = ('127.0.0.1', 11112)
+    SEGMENT_SECONDS = 60  # a new segment starts on the first SPS after this time
+    BATCH_SIZE = 256 * 1024  # bytes of video per write
+    FLUSH_PERIOD = 0.5  # seconds, partial batches are written after this time
+    MAX_PENDING = 16 * 1024 * 1024  # bytes waiting for the writer
+    INDEX_ROWS = 512
+    FRAME_ROWS = 256
+    BUFFER_SIZE = 2048
+    PACKET_SIZE = 1460  # the drone splits frames into packets of this size, a shorter one ends a frame
+    COMPLETIONS = 256  # frame completion times kept to number the side rows
+
+    def __init__(self, directory, listen_address=LISTEN_ADDRESS, relay_address=RELAY_ADDRESS,
+                 segment_seconds=SEGMENT_SECONDS):
+        self.directory = directory
+        self.listen_address = listen_address
+        self.relay_address = relay_address
+        self.segment_seconds = segment_seconds
+        os.makedirs(directory, exist_ok=True)
+
+        self.buffer = bytearray(self.BUFFER_SIZE)
+        self.view = memoryview(self.buffer)
+        self.batch = bytearray()
+        self.batch_time = time()
+        self.segment = 0
+        self.segment_start = None
+        self.segment_offset = 0
+        self.frames = 0
+        self.index = np.zeros(self.INDEX_ROWS, dtype=INDEX_DTYPE)
+        self.index_count = 0
+        self.frame_rows = np.zeros(self.FRAME_ROWS, dtype=FRAME_DTYPE)
+        self.frame_count = 0
+        self.frame_lock = Lock()
+        self.completed = 0
+        self.completions = deque(maxlen=self.COMPLETIONS)  # (time, frame)
+        self.completion_lock = Lock()
+
+        self.writes = Queue()
+        self.pending = 0
+        self.pending_lock = Lock()
+
+        """Statistics"""
+        self.packets = 0
+        self.bytes = 0
+        self.dropped_packets = 0
+        self.written = 0
+        self.flushes = 0
+
+        self.socket = None
+        self.relay_socket = None
+        self.stopped = False
+        self.receiver = Thread(target=self.receive, daemon=True)
+        self.writer = Thread(target=self.write, daemon=True)
+
+    def start(self):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(self.listen_address)
+        self.socket.settimeout(self.FLUSH_PERIOD)
+        self.relay_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.writer.start()
+        self.receiver.start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+        if self.receiver.is_alive():
+            self.receiver.join(1)
+        self.flush_video()
+        self.flush_index()
+        with self.frame_lock:
+            self.flush_frames()
+        self.writes.put(None)
+        self.writer.join(5)
+        if self.socket is not None:
+            self.socket.close()
+            self.relay_socket.close()
+
+    """Video"""
+
+    def receive(self):
+        while not self.stopped:
+            try:
+                size = self.socket.recv_into(self.buffer)
+            except socket.timeout:
+                self.flush_video()
+                continue
+            except OSError:
+                break
+            now = time()
+            packet = self.view[:size]
+            try:
+                self.relay_socket.sendto(packet, self.relay_address)
+            except OSError:
+                pass
+            self.packets += 1
+            self.bytes += size
+            self.record(packet, now)
+            if len(self.batch) >= self.BATCH_SIZE or now - self.batch_time >= self.FLUSH_PERIOD:
+                self.flush_video()
+
+    def scan(self, packet):
+        """Counts frames in PACKET without decoding: a slice NAL unit with first_mb_in_slice == 0 starts a frame.
+        Returns: type of the NAL unit the packet starts with or None if it continues the previous one"""
+        data = bytes(packet)
+        first_type = None
+        i = data.find(b'\x00\x00\x01')
+        while 0 <= i < len(data) - 4:
+            nal_type = data[i + 3] & 0x1f
+            if i <= 1:
+                first_type = nal_type
+            if nal_type in (1, 5) and data[i + 4] & 0x80:
+                self.frames += 1
+            i = data.find(b'\x00\x00\x01', i + 4)
+        return first_type
+
+    def record(self, packet, now):
+        frames = self.frames
+        nal_type = self.scan(packet)
+        if nal_type == 7 and (self.segment_start is None or now - self.segment_start >= self.segment_seconds):
+            if self.segment_start is not None:
+                self.flush_video()
+                self.segment += 1
+                self.segment_offset = 0
+            self.segment_start = now
+        if self.segment_start is None:  # the recording starts with the first SPS, so every segment is decodable
+            self.frames = frames
+            return
+        if self.frames > frames:  # a new frame started, the previous ones are complete
+            self.complete(self.frames - 1, now)
+        if len(packet) < self.PACKET_SIZE:
+            self.complete(self.frames, now)
+        with self.pending_lock:
+            if self.pending + len(self.batch) + len(packet) > self.MAX_PENDING:
+                self.dropped_packets += 1
+                return
+        if nal_type is not None:
+            self.index[self.index_count] = (now, self.segment, self.segment_offset, nal_type, self.frames)
+            self.index_count += 1
+            if self.index_count == self.INDEX_ROWS:
+                self.flush_index()
+        self.batch += packet
+        self.segment_offset += len(packet)
+
+    def complete(self, frame, now):
+        if frame > self.completed:
+            with self.completion_lock:
+                self.completed = frame
+                self.completions.append((now, frame))
+
+    def frame_at(self, timestamp):
+        """Returns: number of the last frame completely received at TIMESTAMP (time()) or -1"""
+        with self.completion_lock:
+            for completed, frame in reversed(self.completions):
+                if completed <= timestamp:
+                    return frame
+        return -1
+
+    def flush_video(self):
+        self.batch_time = time()
+        if not self.batch:
+            return
+        batch, self.batch = self.batch, bytearray()
+        with self.pending_lock:
+            self.pending += len(batch)
+        self.writes.put(("video", self.segment, batch))
+
+    def flush_index(self):
+        if self.index_count:
+            self.writes.put(("index", None, self.index[:self.index_count].copy()))
+            self.index_count = 0
+
+    """Side file"""
+
+    def log_frame(self, seq, timestamp, face=None, vec=None, setpoint=None, state=None):
+        """Adds a side file row, numbered with the recorder frame received by TIMESTAMP.
+        Arguments: seq, timestamp: frame seq and capture time from BackgroundFrameRead,
+        face: (x, y, w, h), vec: directions vector, setpoint: RC velocities (lr, fb, ud, yaw),
+        state: TelloStateListener record, the telemetry columns are -1 without it"""
+        with self.frame_lock:
+            row = self.frame_rows[self.frame_count]
+            row["seq"], row["timestamp"], row["logged"] = seq, timestamp, time()
+            row["frame"] = self.frame_at(timestamp)
+            row["x"], row["y"], row["w"], row["h"] = face if face is not None else (-1, -1, -1, -1)
+            row["vx"], row["vy"], row["vz"] = vec if vec is not None else (0, 0, 0)
+            row["lr"], row["fb"], row["ud"], row["yaw_rc"] = setpoint if setpoint is not None else (0, 0, 0, 0)
+            if state is not None:
+                for name in ("bat", "tof", "pitch", "roll", "yaw"):
+                    row[name] = state[name]
+                row["height"] = state["h"]
+            else:  # the slot is reused after a flush, no telemetry of an older frame may stay in it
+                for name in ("bat", "height", "tof", "pitch", "roll", "yaw"):
+                    row[name] = -1
+            self.frame_count += 1
+            if self.frame_count == self.FRAME_ROWS:
+                self.flush_frames()
+
+    def flush_frames(self):
+        if self.frame_count:
+            self.writes.put(("frames", None, self.frame_rows[:self.frame_count].copy()))
+            self.frame_count = 0
+
+    """Writer"""
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def segment_path(self, segment):
+        return self.path(f"video_{segment:04d}.h264")
+
+    def write(self):
+        files = {"index": open(self.path("index.col"), "wb"), "frames": open(self.path("frames.col"), "wb")}
+        write_header(files["index"], INDEX_DTYPE)
+        write_header(files["frames"], FRAME_DTYPE)
+        video, video_segment = None, None
+        try:
+            while True:
+                item = self.writes.get()
+                if item is None:
+                    break
+                kind, segment, data = item
+                if kind == "video":
+                    if segment != video_segment:
+                        if video is not None:
+                            video.close()
+                        video, video_segment = open(self.segment_path(segment), "ab"), segment
+                    video.write(data)
+                    with self.pending_lock:
+                        self.pending -= len(data)
+                    self.written += len(data)
+                else:
+                    write_block(files[kind], data)
+                self.flushes += 1
+        finally:
+            if video is not None:
+                video.close()
+            for f in files.values():
+                f.close()
+
+    def stats(self):
+        return {"packets": self.packets,
+                "bytes": self.bytes,
+                "frames": self.frames,
+                "segments": self.segment + 1 if self.segment_start is not None else 0,
+                "written": self.written,
+                "pending": self.pending,
+                "flushes": self.flushes,
+                "dropped_packets": self.dropped_packets}
+
+
+def main():
+    """python flight_recorder.py DIRECTORY records until Ctrl+C,
+    python flight_recorder.py DIRECTORY --summary describes a recording"""
+    import sys
+    from time import sleep
+    directory = sys.argv[1] if len(sys.argv) > 1 else "flight"
+    if "--summary" in sys.argv:
+        index = read_columns(os.path.join(directory, "index.col"))
+        frames = read_columns(os.path.join(directory, "frames.col"))
+        segments = sorted(name for name in os.listdir(directory) if name.endswith(".h264"))
+        duration = index["timestamp"][-1] - index["timestamp"][0] if len(index["timestamp"]) else 0
+        print(f"{len(segments)} segments, {int(index['frame'][-1]) if len(index['frame']) else 0} frames "
+              f"in {duration:.1f} s, {len(frames['seq'])} side rows, "
+              f"{int((frames['w'] > 0).sum())} with a face")
+        return
+    recorder = FlightRecorder(directory).start()
+    print(f"Recording to {directory}, video is relayed to {recorder.relay_address}")
+    try:
+        while True:
+            sleep(5)
+            print(recorder.stats())
+    except KeyboardInterrupt:
+        recorder.stop()
+        print(recorder.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import numpy as np
+from cv2 import resize
+
+
+class HUD:
+    """Display layer of FaceVector frames. Frames are resized straight into a preallocated display buffer
+    and annotated there in place, only for a display consumer: headless tracking does not annotate at all"""
+
+    def __init__(self, fv):
+        """Arguments: fv: FaceVector which geometry and drawing are used"""
+        self.fv = fv
+        self.height = fv.height
+        self.width = fv.width
+        self.buffer = np.empty((self.height, self.width, 3), dtype=np.uint8)
+
+        """Statistics"""
+        self.renders = 0
+
+    def render(self, frame, face, vector_3d):
+        """Resizes FRAME into the display buffer and draws the target region, FACE and VECTOR_3D there.
+        The buffer is reused by the next call. Returns: the buffer"""
+        if frame.shape[:2] == (self.height, self.width):
+            np.copyto(self.buffer, frame)
+        else:
+            resize(frame, (self.width, self.height), dst=self.buffer)
+        self.fv.frame_processing(self.buffer)
+        self.fv.face_definition(self.buffer, face)
+        self.fv.text_addition(self.buffer, vector_3d)
+        self.renders += 1
+        return self.buffer
+
+
+def main():
+    from time import perf_counter
+    from face_vector import FaceVector
+    fv = FaceVector(480, 640)
+    hud = HUD(fv)
+    frame = np.random.randint(0, 255, (720, 960, 3), dtype=np.uint8)
+    face, vec = (280, 200, 80, 80), [1, -1, 0]
+    repeat = 1000
+
+    start = perf_counter()
+    for _ in range(repeat):
+        image = resize(frame, (fv.width, fv.height))
+        image = fv.face_definition(fv.frame_processing(image), face)
+        fv.text_addition(image, vec)
+    allocating = (perf_counter() - start) / repeat
+
+    start = perf_counter()
+    for _ in range(repeat):
+        hud.render(frame, face, vec)
+    rendering = (perf_counter() - start) / repeat
+    print(f"resize and annotate: {allocating * 1000:.3f} ms, HUD rendering: {rendering * 1000:.3f} ms per frame")
+
+
+if __name__ == "__main__":
+    main()
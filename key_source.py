@@ -0,0 +1,133 @@
+import socket
+import sys
+from abc import ABC, abstractmethod
+from queue import Queue, Empty
+from threading import Thread
+
+
+class KeySource(ABC):
+    """Non-blocking keyboard input for the headless mode. get() returns key codes like waitKey(...) & 0xff does,
+    NO_KEY if nothing was pressed"""
+
+    """Constants"""
+    NO_KEY = 0xff
+
+    def __init__(self):
+        self.keys = Queue()
+        self.stopped = False
+        self.worker = Thread(target=self.read, daemon=True)
+
+    def start(self):
+        self.worker.start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+
+    @abstractmethod
+    def read(self):
+        """Worker loop: reads keys until stopped and passes them to put_keys"""
+
+    def put_keys(self, data):
+        for byte in data:
+            if byte not in (ord('\n'), ord('\r')):
+                self.keys.put(byte)
+
+    def get(self, timeout=0):
+        """Returns: the next pressed key code or NO_KEY, waits for a key up to TIMEOUT seconds"""
+        try:
+            if timeout > 0:
+                return self.keys.get(timeout=timeout)
+            return self.keys.get_nowait()
+        except Empty:
+            return self.NO_KEY
+
+
+class StdinKeySource(KeySource):
+    """Keys typed in the terminal. A terminal is switched to cbreak mode where it is possible,
+    so keys come without Enter, otherwise every line is a sequence of keys"""
+
+    def __init__(self):
+        super().__init__()
+        self.terminal = None
+
+    def start(self):
+        if sys.stdin.isatty():
+            try:
+                import termios
+                import tty
+                fd = sys.stdin.fileno()
+                self.terminal = (termios, fd, termios.tcgetattr(fd))
+                tty.setcbreak(fd)
+            except ImportError:  # Windows
+                self.terminal = None
+        return super().start()
+
+    def stop(self):
+        super().stop()
+        if self.terminal is not None:
+            termios, fd, attributes = self.terminal
+            termios.tcsetattr(fd, termios.TCSADRAIN, attributes)
+            self.terminal = None
+
+    def read(self):
+        stdin = sys.stdin.buffer
+        while not self.stopped:
+            data = stdin.read1(64) if self.terminal is not None else stdin.readline()
+            if not data:
+                return
+            self.put_keys(data)
+
+
+class SocketKeySource(KeySource):
+    """Keys sent as UDP datagrams to a local port, e.g. echo -n t | nc -u -w0 127.0.0.1 9999"""
+
+    """Constants"""
+    ADDRESS = ('127.0.0.1', 9999)
+    BUFFER_SIZE = 64
+
+    def __init__(self, address=ADDRESS):
+        super().__init__()
+        self.address = address
+        self.socket = None
+
+    def start(self):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(self.address)
+        self.socket.settimeout(0.5)
+        return super().start()
+
+    def stop(self):
+        super().stop()
+        if self.worker.is_alive():
+            self.worker.join(1)
+        if self.socket is not None:
+            self.socket.close()
+
+    def read(self):
+        while not self.stopped:
+            try:
+                data = self.socket.recv(self.BUFFER_SIZE)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.put_keys(data)
+
+
+def main():
+    source = SocketKeySource().start() if "--socket" in sys.argv else StdinKeySource().start()
+    print("Press keys, q to quit")
+    try:
+        while True:
+            key = source.get(0.1)
+            if key != source.NO_KEY:
+                print("key", chr(key), key)
+                if key == ord('q'):
+                    break
+    finally:
+        source.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+import json
+import os
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread, Lock, Event
+from time import perf_counter, time
+
+
+"""Histogram bucket upper bounds, seconds: 50 us doubling up to ~13 s"""
+
+BUCKETS = tuple(0.00005 * 2 ** i for i in range(19))
+
+
+class Histogram:
+    """Streaming histogram with fixed buckets, memory does not grow with the number of observations"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        i = bisect_left(BUCKETS, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q):
+        """Quantile estimate, linear inside the bucket"""
+        with self.lock:
+            counts, count, maximum = list(self.counts), self.count, self.max
+        if count == 0:
+            return None
+        rank = q * count
+        seen = 0
+        for i, n in enumerate(counts):
+            if n and seen + n >= rank:
+                low = BUCKETS[i - 1] if i > 0 else 0.0
+                high = min(BUCKETS[i], maximum) if i < len(BUCKETS) else maximum
+                return min(low, high) + (high - min(low, high)) * (rank - seen) / n
+            seen += n
+        return maximum
+
+    def summary(self):
+        return {"count": self.count,
+                "mean": self.sum / self.count if self.count else None,
+                "p50": self.quantile(0.5),
+                "p95": self.quantile(0.95),
+                "p99": self.quantile(0.99),
+                "max": self.max}
+
+
+class Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start = None
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.histogram.observe(perf_counter() - self.start)
+        return False
+
+
+class NullTimer:
+    """Timer of the disabled registry: does nothing"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class Registry:
+    """Timers (histograms), counters and gauges by name. While disabled every call returns right away,
+    so instrumented code costs a method call and a flag check"""
+
+    def __init__(self, enabled=False, prefix="tellovision"):
+        self.enabled = enabled
+        self.prefix = prefix
+        self.lock = Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.started = time()
+
+    def enable(self):
+        self.enabled = True
+        return self
+
+    def disable(self):
+        self.enabled = False
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        return histogram
+
+    def timer(self, name):
+        """Returns: context manager timing the block into histogram NAME"""
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self.histogram(name))
+
+    def observe(self, name, seconds):
+        if self.enabled:
+            self.histogram(name).observe(seconds)
+
+    def inc(self, name, value=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name, value):
+        if self.enabled:
+            with self.lock:
+                self.gauges[name] = value
+
+    """Export"""
+
+    def prometheus(self):
+        """Returns: all metrics in Prometheus text exposition format"""
+        with self.lock:
+            histograms, counters, gauges = sorted(self.histograms.items()), sorted(self.counters.items()), \
+                sorted(self.gauges.items())
+        lines = []
+        for name, histogram in histograms:
+            metric = f"{self.prefix}_{name}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            with histogram.lock:
+                counts, count, total = list(histogram.counts), histogram.count, histogram.sum
+            cumulative = 0
+            for bound, n in zip(BUCKETS, counts):
+                cumulative += n
+                lines.append(f'{metric}_bucket{{le="{bound:.6g}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {count}')
+            lines.append(f"{metric}_sum {total:.9g}")
+            lines.append(f"{metric}_count {count}")
+        for name, value in counters:
+            lines.append(f"# TYPE {self.prefix}_{name}_total counter")
+            lines.append(f"{self.prefix}_{name}_total {value}")
+        for name, value in gauges:
+            lines.append(f"# TYPE {self.prefix}_{name} gauge")
+            lines.append(f"{self.prefix}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """Returns: JSON-serialisable dict with histogram summaries, counters and gauges"""
+        with self.lock:
+            histograms, counters, gauges = sorted(self.histograms.items()), dict(self.counters), dict(self.gauges)
+        return {"timestamp": time(),
+                "uptime": time() - self.started,
+                "timers": {name: histogram.summary() for name, histogram in histograms},
+                "counters": counters,
+                "gauges": gauges}
+
+
+"""Registry used by the instrumented modules, disabled until enabled"""
+
+METRICS = Registry()
+
+
+class MetricsServer:
+    """Serves /metrics (Prometheus text format) and /metrics.json on a local port
+    and optionally writes the JSON snapshot to a file every SNAPSHOT_PERIOD seconds"""
+
+    """Constants"""
+    ADDRESS = ('127.0.0.1', 9109)
+    SNAPSHOT_PERIOD = 5.0
+
+    def __init__(self, registry=METRICS, address=ADDRESS, snapshot_path=None, snapshot_period=SNAPSHOT_PERIOD):
+        self.registry = registry
+        self.address = address
+        self.snapshot_path = snapshot_path
+        self.snapshot_period = snapshot_period
+        self.stopped = Event()
+        self.http = None
+        self.threads = []
+
+    def start(self):
+        if self.address is not None:
+            self.http = ThreadingHTTPServer(self.address, self.handler())
+            self.http.daemon_threads = True
+            self.threads.append(Thread(target=self.http.serve_forever, daemon=True))
+        if self.snapshot_path is not None:
+            self.threads.append(Thread(target=self.write_snapshots, daemon=True))
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.http is not None:
+            self.http.shutdown()
+            self.http.server_close()
+        if self.snapshot_path is not None:
+            self.write_snapshot()
+
+    def write_snapshot(self):
+        temporary = self.snapshot_path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(self.registry.snapshot(), f, indent=1)
+        os.replace(temporary, self.snapshot_path)
+
+    def write_snapshots(self):
+        while not self.stopped.wait(self.snapshot_period):
+            self.write_snapshot()
+
+    def handler(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = registry.prometheus().encode("utf-8"), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, content_type = json.dumps(registry.snapshot()).encode("utf-8"), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def main():
+    """Measures the cost of a timed block with the registry disabled and enabled"""
+    registry = Registry()
+    repeat = 200000
+    for enabled in (False, True):
+        registry.enabled = enabled
+        start = perf_counter()
+        for _ in range(repeat):
+            with registry.timer("block"):
+                pass
+            registry.inc("blocks")
+        cost = (perf_counter() - start) / repeat
+        print(f"{'enabled' if enabled else 'disabled'}: {cost * 1e9:.0f} ns per timed block and counter")
+    print(registry.prometheus().splitlines()[-4:])
+
+
+if __name__ == "__main__":
+    main()
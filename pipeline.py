@@ -0,0 +1,154 @@
+from collections import deque
+from threading import Thread, Condition, Lock
+from time import perf_counter, sleep
+from metrics import METRICS
+
+
+class DropOldestQueue:
+    """Bounded queue. When it is full the oldest item is dropped, so consumers always get fresh data"""
+
+    def __init__(self, maxsize=1):
+        self.items = deque(maxlen=maxsize)
+        self.condition = Condition()
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, item):
+        with self.condition:
+            if len(self.items) == self.items.maxlen:
+                self.dropped += 1
+            self.items.append(item)
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        """Returns: the oldest item or None on timeout or when the queue is closed"""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.items or self.closed, timeout):
+                return None
+            if not self.items:
+                return None
+            return self.items.popleft()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def __len__(self):
+        return len(self.items)
+
+
+class LatestSlot:
+    """Holds only the last published value. Reading does not consume it"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.value = None
+        self.seq = 0
+        self.timestamp = None
+
+    def put(self, value):
+        with self.lock:
+            self.value = value
+            self.seq += 1
+            self.timestamp = perf_counter()
+
+    def get(self):
+        """Returns: (seq, timestamp, value)"""
+        with self.lock:
+            return self.seq, self.timestamp, self.value
+
+    def age(self):
+        """Seconds since the last put or None if nothing was published"""
+        with self.lock:
+            if self.timestamp is None:
+                return None
+            return perf_counter() - self.timestamp
+
+
+class RateScheduler:
+    """Keeps a loop at a fixed rate. Sleeps only the rest of the period and skips missed ticks"""
+
+    def __init__(self, rate):
+        self.period = 1 / rate
+        self.next_tick = None
+        self.ticks = 0
+        self.overruns = 0
+
+    def wait(self):
+        now = perf_counter()
+        if self.next_tick is None:
+            self.next_tick = now
+        self.next_tick += self.period
+        delay = self.next_tick - now
+        if delay > 0:
+            sleep(delay)
+        else:
+            self.overruns += 1
+            missed = int(-delay / self.period) + 1
+            self.next_tick += missed * self.period
+        self.ticks += 1
+
+
+class Stage:
+    """Pipeline stage running in a separate thread and measuring its throughput.
+    Arguments: source: blocking function returning the next item or None if there is nothing to process,
+    work: function processing the item, setup: function called once in the stage thread before the first item.
+    Only the work time is counted as busy time"""
+
+    def __init__(self, name, work, source, setup=None):
+        self.name = name
+        self.metric = f"stage_{name}"
+        self.work = work
+        self.source = source
+        self.setup = setup
+        self.processed = 0
+        self.busy_time = 0.0
+        self.started = None
+        self.stopped = False
+        self.worker = None
+
+    def start(self):
+        self.started = perf_counter()
+        self.worker = Thread(target=self.loop, name=self.name, daemon=True)
+        self.worker.start()
+        return self
+
+    def loop(self):
+        if self.setup is not None:
+            self.setup()
+        while not self.stopped:
+            self.run_step()
+
+    def run_step(self):
+        if self.started is None:
+            self.started = perf_counter()
+        item = self.source()
+        if item is None:
+            return False
+        start = perf_counter()
+        self.work(item)
+        busy = perf_counter() - start
+        self.busy_time += busy
+        METRICS.observe(self.metric, busy)
+        self.processed += 1
+        return True
+
+    def stop(self):
+        self.stopped = True
+        if self.worker is not None and self.worker.is_alive():
+            self.worker.join(1)
+
+    def stats(self):
+        """Returns: dict with processed items, throughput (items/s), mean work time and utilization of the stage"""
+        elapsed = perf_counter() - self.started if self.started is not None else 0.0
+        return {"stage": self.name,
+                "processed": self.processed,
+                "fps": self.processed / elapsed if elapsed > 0 else 0.0,
+                "latency": self.busy_time / self.processed if self.processed else 0.0,
+                "utilization": self.busy_time / elapsed if elapsed > 0 else 0.0}
+
+
+def format_stats(stages):
+    return " | ".join(f"{s['stage']}: {s['fps']:.1f} fps, {s['latency'] * 1000:.1f} ms, {s['utilization'] * 100:.0f}%"
+                      for s in (stage.stats() for stage in stages))
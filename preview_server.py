@@ -0,0 +1,168 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread, Condition
+from time import perf_counter
+from cv2 import imencode, IMWRITE_JPEG_QUALITY
+
+
+class MJPEGServer:
+    """Serves the preview as MJPEG over HTTP (open http://127.0.0.1:8080/ in a browser).
+    publish() only keeps a copy of the newest frame and never waits. JPEG encoding runs in its own thread,
+    only while there are clients, and always takes the newest frame, so frames are skipped instead of queued.
+    Every client gets the newest JPEG when it is ready for the next one, slow clients skip frames too"""
+
+    """Constants"""
+    ADDRESS = ('127.0.0.1', 8080)
+    QUALITY = 70
+    BOUNDARY = "frame"
+
+    def __init__(self, address=ADDRESS, quality=QUALITY):
+        self.address = address
+        self.quality = quality
+        self.condition = Condition()
+        self.frame = None
+        self.frame_seq = 0
+        self.encoded_seq = 0  # the last frame taken by the encoder
+        self.jpeg = None
+        self.jpeg_seq = 0
+        self.clients = 0
+        self.stopped = False
+
+        """Statistics"""
+        self.published = 0
+        self.encoded = 0
+        self.skipped = 0  # published frames never encoded
+        self.sent = 0
+        self.encoding_time = 0.0
+
+        self.http = ThreadingHTTPServer(address, self.handler())
+        self.http.daemon_threads = True
+        self.server_thread = Thread(target=self.http.serve_forever, daemon=True)
+        self.encoder = Thread(target=self.encode, daemon=True)
+
+    def start(self):
+        self.server_thread.start()
+        self.encoder.start()
+        return self
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        self.http.shutdown()
+        self.http.server_close()
+        self.encoder.join(1)
+
+    def url(self):
+        return f"http://{self.address[0]}:{self.http.server_address[1]}/"
+
+    def publish(self, frame):
+        """Arguments: frame: BGR image, copied only when somebody is watching"""
+        with self.condition:
+            if self.clients == 0:
+                return
+            if self.frame_seq > self.encoded_seq:
+                self.skipped += 1
+            self.frame = frame.copy()
+            self.frame_seq += 1
+            self.published += 1
+            self.condition.notify_all()
+
+    def encode(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.stopped or (self.clients > 0 and
+                                                                 self.frame_seq > self.encoded_seq))
+                if self.stopped:
+                    return
+                frame, seq = self.frame, self.frame_seq
+                self.encoded_seq = seq
+            start = perf_counter()
+            ok, jpeg = imencode(".jpg", frame, [IMWRITE_JPEG_QUALITY, self.quality])
+            if not ok:
+                continue
+            with self.condition:
+                self.encoding_time += perf_counter() - start
+                self.encoded += 1
+                self.jpeg = jpeg.tobytes()
+                self.jpeg_seq += 1
+                self.condition.notify_all()
+
+    def next_jpeg(self, seq, timeout=1.0):
+        """Returns: (seq, jpeg) newer than SEQ or None on timeout or stop"""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.stopped or self.jpeg_seq > seq, timeout):
+                return None
+            if self.stopped:
+                return None
+            return self.jpeg_seq, self.jpeg
+
+    def handler(self):
+        preview = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path not in ("/", "/stream.mjpg"):
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={preview.BOUNDARY}")
+                self.end_headers()
+                with preview.condition:
+                    preview.clients += 1
+                    preview.condition.notify_all()
+                seq = 0
+                try:
+                    while not preview.stopped:
+                        latest = preview.next_jpeg(seq)
+                        if latest is None:
+                            continue
+                        seq, jpeg = latest
+                        self.wfile.write(f"--{preview.BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                                         f"Content-Length: {len(jpeg)}\r\n\r\n".encode("ascii"))
+                        self.wfile.write(jpeg)
+                        self.wfile.write(b"\r\n")
+                        preview.sent += 1
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    with preview.condition:
+                        preview.clients -= 1
+
+        return Handler
+
+    def stats(self):
+        return {"clients": self.clients,
+                "published": self.published,
+                "encoded": self.encoded,
+                "skipped": self.skipped,
+                "sent": self.sent,
+                "mean_encoding_time": self.encoding_time / self.encoded if self.encoded else None}
+
+
+def main():
+    import numpy as np
+    from time import sleep
+    from cv2 import putText, FONT_HERSHEY_COMPLEX
+    preview = MJPEGServer().start()
+    print("Preview at", preview.url())
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    try:
+        n = 0
+        while True:
+            frame[:] = 0
+            putText(frame, str(n), (250, 260), FONT_HERSHEY_COMPLEX, 3, (255, 255, 255))
+            preview.publish(frame)
+            n += 1
+            sleep(1 / 30)
+            if n % 150 == 0:
+                print(preview.stats())
+    except KeyboardInterrupt:
+        preview.stop()
+
+
+if __name__ == "__main__":
+    main()
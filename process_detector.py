@@ -0,0 +1,248 @@
+import os
+import multiprocessing
+from multiprocessing import shared_memory
+from queue import Queue
+from threading import Thread, Condition, Lock
+from time import perf_counter
+import numpy as np
+from face_detector import FaceDetector
+
+
+def detection_worker(shm, slot_bytes, tasks, results, cascade_path):
+    """Worker process loop: reads frames from shared memory slots and sends back found faces"""
+    detector = FaceDetector(cascade_path)
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        seq, slot, shape, parameters = task
+        image = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=slot * slot_bytes)
+        try:
+            faces = detector.detect(image, **parameters)
+            faces = [tuple(int(v) for v in face) for face in faces]
+        except Exception as e:
+            faces = e
+        del image
+        results.put((seq, slot, faces, detector.last_detection_time))
+    shm.close()
+
+
+class ProcessFaceDetector:
+    """Face detection in a pool of worker processes.
+    Frames are passed through ring slots in shared memory, only (seq, slot, shape) and found faces are sent over queues.
+    Has the same detect(image) interface as FaceDetector, so it can be given to FaceVector.
+    A worker that dies may leave a queue lock taken, so the whole pool is restarted with new queues while
+    a result is awaited, and the frames in flight fail with RuntimeError"""
+
+    """Constants"""
+    TIMEOUT = 5.0  # seconds detect() waits for a result
+    CHECK_INTERVAL = 0.5  # seconds between worker liveness checks while waiting
+
+    def __init__(self, max_shape=(720, 960, 3), workers=None, slots=None, cascade_path=None):
+        """Arguments: max_shape: biggest frame shape, workers: number of processes (cpu count by default),
+        slots: number of shared memory slots (two per worker by default), cascade_path: cascade for workers"""
+        self.workers_number = workers if workers is not None else max(1, os.cpu_count() or 1)
+        self.slots_number = slots if slots is not None else 2 * self.workers_number
+        self.slot_bytes = int(np.prod(max_shape))
+        self.shm = shared_memory.SharedMemory(create=True, size=self.slot_bytes * self.slots_number)
+
+        self.free_slots = Queue()
+        for slot in range(self.slots_number):
+            self.free_slots.put(slot)
+
+        methods = multiprocessing.get_all_start_methods()
+        self.context = multiprocessing.get_context("fork" if "fork" in methods else None)
+        self.cascade_path = cascade_path
+        self.workers_lock = Lock()
+        self.tasks = self.results = self.workers = self.dispatcher = None
+
+        self.condition = Condition()
+        self.finished = {}
+        self.submitted = {}  # seq: (submit time, slot)
+        self.abandoned = set()  # timed out seqs, their late results are dropped
+        self.seq = 0
+        self.seq_lock = Lock()
+        self.closed = False
+
+        """Statistics"""
+        self.detections = 0
+        self.detection_time = 0.0
+        self.last_detection_time = 0.0
+        self.round_trip_time = 0.0
+        self.restarts = 0
+
+        self.start_workers()
+
+    def start_workers(self):
+        """Starts the workers and the result dispatcher on new queues"""
+        self.tasks = self.context.SimpleQueue()
+        self.results = self.context.SimpleQueue()
+        self.workers = [self.context.Process(target=detection_worker,
+                                             args=(self.shm, self.slot_bytes, self.tasks, self.results,
+                                                   self.cascade_path),
+                                             daemon=True)
+                        for _ in range(self.workers_number)]
+        for worker in self.workers:
+            worker.start()
+        self.dispatcher = Thread(target=self.dispatch_results, args=(self.results,), daemon=True)
+        self.dispatcher.start()
+
+    def restart_if_dead(self):
+        """Restarts the pool if a worker died. Frames in flight get RuntimeError as their result"""
+        with self.workers_lock:
+            if self.closed or all(worker.is_alive() for worker in self.workers):
+                return
+            for worker in self.workers:
+                worker.terminate()
+                worker.join(1)
+            old_results = self.results
+            with self.condition:
+                for seq, (_, slot) in self.submitted.items():
+                    self.free_slots.put(slot)
+                    if seq in self.abandoned:
+                        self.abandoned.discard(seq)
+                    else:
+                        self.finished[seq] = RuntimeError(f"Detection worker died with frame {seq}")
+                self.submitted.clear()
+                self.restarts += 1
+                self.start_workers()
+                self.condition.notify_all()
+        # stops the old dispatcher unless a killed worker kept the write lock of its queue
+        Thread(target=old_results.put, args=(None,), daemon=True).start()
+
+    def dispatch_results(self, results):
+        while True:
+            result = results.get()
+            if result is None:
+                break
+            seq, slot, faces, detection_time = result
+            with self.condition:
+                submitted = self.submitted.pop(seq, None)
+                if submitted is None:  # the slot was reclaimed by a restart
+                    continue
+                self.free_slots.put(slot)
+                if seq in self.abandoned:
+                    self.abandoned.discard(seq)
+                    continue
+                round_trip = perf_counter() - submitted[0]
+                self.finished[seq] = faces
+                self.detections += 1
+                self.detection_time += detection_time
+                self.last_detection_time = detection_time
+                self.round_trip_time += round_trip
+                self.condition.notify_all()
+
+    def submit(self, image, scale_factor=None, min_size=None, max_size=None):
+        """Copies BGR image into a free slot and queues it for detection. Blocks while all slots are busy.
+        Returns: frame seq to get the result with"""
+        if self.closed:
+            raise RuntimeError("Detector is closed")
+        if image.dtype != np.uint8 or image.nbytes > self.slot_bytes:
+            raise ValueError(f"Frame {image.shape} {image.dtype} does not fit into a {self.slot_bytes} bytes slot")
+        slot = self.free_slots.get()
+        view = np.ndarray(image.shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+        view[...] = image
+        del view
+        with self.seq_lock:
+            self.seq += 1
+            seq = self.seq
+        parameters = {"scale_factor": scale_factor, "min_size": min_size, "max_size": max_size}
+        with self.condition:  # a restart swaps the queues and reclaims the submitted slots under it
+            self.submitted[seq] = (perf_counter(), slot)
+            self.tasks.put((seq, slot, image.shape, parameters))
+        return seq
+
+    def result(self, seq, timeout=None):
+        """Waits for faces found on the frame with given seq, restarts the pool if a worker died meanwhile.
+        Returns: faces (x, y, w, h) or None on timeout"""
+        deadline = perf_counter() + timeout if timeout is not None else None
+        while True:
+            wait = self.CHECK_INTERVAL
+            if deadline is not None:
+                wait = max(0.0, min(wait, deadline - perf_counter()))
+            with self.condition:
+                if self.condition.wait_for(lambda: seq in self.finished, wait):
+                    faces = self.finished.pop(seq)
+                    break
+            self.restart_if_dead()
+            if deadline is not None and perf_counter() >= deadline:
+                with self.condition:
+                    if seq in self.finished:
+                        faces = self.finished.pop(seq)
+                        break
+                    if seq in self.submitted:
+                        self.abandoned.add(seq)
+                return None
+        if isinstance(faces, Exception):
+            raise faces
+        if len(faces) == 0:
+            return ()
+        return np.array(faces, dtype=np.int32)
+
+    def detect(self, image, scale_factor=None, min_size=None, max_size=None):
+        """Returns faces (x, y, w, h) found on the BGR image.
+        Raises: TimeoutError without a result in TIMEOUT, RuntimeError if the worker died with the frame"""
+        seq = self.submit(image, scale_factor, min_size, max_size)
+        faces = self.result(seq, self.TIMEOUT)
+        if faces is None:
+            raise TimeoutError(f"No detection result for frame {seq} in {self.TIMEOUT} s")
+        return faces
+
+    def close(self):
+        with self.workers_lock:
+            if self.closed:
+                return
+            self.closed = True
+        for _ in self.workers:
+            self.tasks.put(None)
+        for worker in self.workers:
+            worker.join(1)
+            if worker.is_alive():
+                worker.terminate()
+        self.results.put(None)
+        self.dispatcher.join(1)
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    """Statistics"""
+
+    def mean_detection_time(self):
+        if self.detections == 0:
+            return 0.0
+        return self.detection_time / self.detections
+
+    def stats(self):
+        with self.condition:
+            return {"workers": self.workers_number,
+                    "slots": self.slots_number,
+                    "detections": self.detections,
+                    "restarts": self.restarts,
+                    "detection_time": self.detection_time,
+                    "last_detection_time": self.last_detection_time,
+                    "mean_detection_time": self.detection_time / self.detections if self.detections else 0.0,
+                    "mean_round_trip_time": self.round_trip_time / self.detections if self.detections else 0.0}
+
+
+def main():
+    from concurrent.futures import ThreadPoolExecutor
+    from face_vector import FaceVector
+    resolution = (960, 720)
+    frames = [np.random.randint(0, 255, (resolution[1], resolution[0], 3), dtype=np.uint8) for _ in range(32)]
+    with ProcessFaceDetector((resolution[1], resolution[0], 3)) as detector:
+        fv = FaceVector(resolution[1], resolution[0], detector)
+        start = perf_counter()
+        with ThreadPoolExecutor(detector.workers_number) as executor:
+            vectors = list(executor.map(fv.direction_vector_3d, frames))
+        elapsed = perf_counter() - start
+        print(vectors)
+        print(f"{len(frames) / elapsed:.1f} fps with {detector.workers_number} workers", detector.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+import json
+import os
+import socket
+import sys
+from collections import Counter
+from threading import Thread, Lock, Event, current_thread, get_ident, enumerate as threads
+from time import perf_counter, sleep, strftime
+
+
+class StageHooks:
+    """User callbacks at the stage boundaries of the tracking loop. A callback is called as
+    callback(event, timestamp, data) in the thread of the stage, timestamp is perf_counter(),
+    data is a dict (seq of the frame, face, vec, velocities...). Emitting without callbacks costs a dict lookup"""
+
+    """Constants"""
+    EVENTS = ("frame_acquired", "faces_detected", "vector_computed", "command_sent")
+
+    def __init__(self):
+        self.lock = Lock()
+        self.callbacks = {event: () for event in self.EVENTS}
+
+    def add(self, event, callback):
+        if event not in self.callbacks:
+            raise ValueError(f"Unknown event {event}, known: {', '.join(self.EVENTS)}")
+        with self.lock:
+            self.callbacks[event] = self.callbacks[event] + (callback,)
+
+    def remove(self, event, callback):
+        with self.lock:
+            self.callbacks[event] = tuple(c for c in self.callbacks[event] if c != callback)
+
+    def emit(self, event, **data):
+        callbacks = self.callbacks[event]
+        if callbacks:
+            timestamp = perf_counter()
+            for callback in callbacks:
+                callback(event, timestamp, data)
+
+
+class SamplingProfiler:
+    """Samples the stacks of all threads every INTERVAL seconds from its own thread and counts them
+    in the folded format ("thread;outer;...;inner count") read by flamegraph.pl, speedscope and others.
+    The sampler needs the GIL, so while sampling the interpreter switch interval is lowered to INTERVAL / 5,
+    otherwise pure Python work shorter than the default 5 ms would rarely be seen"""
+
+    """Constants"""
+    INTERVAL = 0.005
+
+    def __init__(self, interval=INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.stopped = Event()
+        self.sampler = Thread(target=self.sample, name="profiler", daemon=True)
+        self.switch_interval = None
+
+    def start(self):
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self.switch_interval, self.interval / 5))
+        self.sampler.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.sampler.join(1)
+        sys.setswitchinterval(self.switch_interval)
+
+    @staticmethod
+    def label(code):
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def sample(self):
+        own = get_ident()
+        labels = {}
+        while not self.stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threads()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = self.label(code)
+                    stack.append(label)
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class Timeline:
+    """Per-frame timeline of stage durations in the Chrome trace event format (chrome://tracing, Perfetto).
+    A stage span ends at its hook event and starts at the latest earlier event of the same frame,
+    but not before the previous event of the same thread, so queue waits of the pipeline are not counted"""
+
+    """Constants"""
+    STAGES = {"frame_acquired": "acquire", "faces_detected": "detection",
+              "vector_computed": "vector", "command_sent": "command"}
+
+    def __init__(self):
+        self.lock = Lock()
+        self.events = []
+        self.thread_last = {}
+        self.frame_last = {}
+        self.started = perf_counter()
+
+    def attach(self, hooks):
+        for event in StageHooks.EVENTS:
+            hooks.add(event, self.on_event)
+
+    def detach(self, hooks):
+        for event in StageHooks.EVENTS:
+            hooks.remove(event, self.on_event)
+
+    def on_event(self, event, timestamp, data):
+        thread = current_thread()
+        seq = data.get("seq")
+        with self.lock:
+            start = self.thread_last.get(thread.ident, self.started)
+            if seq is not None and event != "frame_acquired":
+                start = max(start, self.frame_last.get(seq, start))
+            self.thread_last[thread.ident] = timestamp
+            if seq is not None:
+                self.frame_last[seq] = timestamp
+                if len(self.frame_last) > 64:
+                    del self.frame_last[min(self.frame_last)]
+            self.events.append({"name": self.STAGES[event], "ph": "X", "pid": os.getpid(), "tid": thread.name,
+                                "ts": (start - self.started) * 1e6, "dur": (timestamp - start) * 1e6,
+                                "args": {"seq": seq}})
+
+    def write(self, path):
+        with self.lock:
+            events = list(self.events)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+class ProfileCapture:
+    """Time-boxed capture: sampling stack profile and stage timeline for DURATION seconds,
+    written to DIRECTORY as profile_<time>.folded and timeline_<time>.json"""
+
+    """Constants"""
+    DURATION = 10
+
+    def __init__(self, hooks, directory="profiles", duration=DURATION):
+        self.hooks = hooks
+        self.directory = directory
+        self.duration = duration
+        self.lock = Lock()
+        self.running = False
+        self.paths = None
+
+    def start(self, duration=None):
+        """Starts a capture unless one is running. Returns: bool: True if started"""
+        with self.lock:
+            if self.running:
+                return False
+            self.running = True
+        Thread(target=self.capture, args=(duration or self.duration,), name="profile capture", daemon=True).start()
+        return True
+
+    def capture(self, duration):
+        try:
+            timeline = Timeline()
+            timeline.attach(self.hooks)
+            try:
+                profiler = SamplingProfiler().start()
+                try:
+                    sleep(duration)
+                finally:
+                    profiler.stop()
+            finally:
+                timeline.detach(self.hooks)
+            os.makedirs(self.directory, exist_ok=True)
+            name = strftime("%Y%m%d_%H%M%S")
+            paths = (os.path.join(self.directory, f"profile_{name}.folded"),
+                     os.path.join(self.directory, f"timeline_{name}.json"))
+            profiler.write(paths[0])
+            timeline.write(paths[1])
+            self.paths = paths
+            print(f"Profile: {profiler.samples} samples in {paths[0]}, {len(timeline.events)} spans in {paths[1]}")
+        finally:
+            with self.lock:
+                self.running = False
+
+
+class ProfileControl:
+    """Local control socket: a UDP datagram "profile [SECONDS]" starts a capture,
+    e.g. echo -n "profile 5" | nc -u -w0 127.0.0.1 9998"""
+
+    """Constants"""
+    ADDRESS = ('127.0.0.1', 9998)
+
+    def __init__(self, capture, address=ADDRESS):
+        self.capture = capture
+        self.address = address
+        self.socket = None
+        self.stopped = False
+
+    def start(self):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(self.address)
+        self.socket.settimeout(0.5)
+        Thread(target=self.receive, name="profile control", daemon=True).start()
+        return self
+
+    def receive(self):
+        while not self.stopped:
+            try:
+                data, sender = self.socket.recvfrom(64)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            words = data.decode("ascii", errors="replace").split()
+            if words and words[0] == "profile":
+                try:
+                    duration = float(words[1]) if len(words) > 1 else None
+                except ValueError:
+                    self.socket.sendto(f"error: bad duration {words[1]}".encode("ascii", errors="replace"), sender)
+                    continue
+                if duration is not None and not 0 < duration < float("inf"):
+                    self.socket.sendto(b"error: duration must be positive", sender)
+                    continue
+                started = self.capture.start(duration)
+                self.socket.sendto(b"started" if started else b"busy", sender)
+
+    def stop(self):
+        self.stopped = True
+        if self.socket is not None:
+            self.socket.close()
+
+
+def main():
+    """Profiles a toy two-stage loop for 2 seconds and prints the hottest stacks"""
+    hooks = StageHooks()
+    capture = ProfileCapture(hooks, "profiles", 2)
+    counts = Counter()
+    hooks.add("faces_detected", lambda event, timestamp, data: counts.update([event]))
+    capture.start()
+    seq = 0
+    deadline = perf_counter() + 2.5
+    while perf_counter() < deadline:
+        seq += 1
+        sleep(0.01)
+        hooks.emit("frame_acquired", seq=seq)
+        sum(i * i for i in range(100000))
+        hooks.emit("faces_detected", seq=seq)
+        hooks.emit("vector_computed", seq=seq)
+        hooks.emit("command_sent", seq=seq)
+    while capture.running:
+        sleep(0.1)
+    print("Callback calls:", dict(counts))
+    with open(capture.paths[0]) as f:
+        for line in f.readlines()[:3]:
+            print(line.strip()[-120:])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+from collections import deque
+from threading import Thread, Lock
+from time import perf_counter, sleep
+from metrics import METRICS
+
+
+class RCScheduler:
+    """Sends the most recent RC setpoint to Tello at a fixed rate in its own thread.
+    Writers only put velocities into a shared slot. The watchdog replaces a setpoint older than stale_timeout
+    with zero velocities, sends them WATCHDOG_REPEATS times and stays idle until a new setpoint comes,
+    so discrete move commands are not disturbed"""
+
+    """Constants"""
+    RATE = 10  # RC commands per second
+    STALE_TIMEOUT = 0.5  # seconds
+    WATCHDOG_REPEATS = 3  # zero setpoints sent after a stale one
+    WINDOW = 200  # jitter samples kept for statistics
+
+    def __init__(self, tello, rate=RATE, stale_timeout=STALE_TIMEOUT):
+        self.tello = tello
+        self.period = 1 / rate
+        self.stale_timeout = stale_timeout
+        self.lock = Lock()
+        self.setpoint = None
+        self.setpoint_time = None
+        self.unsent = False
+        self.zeros_left = 0
+        self.enabled = False
+        self.stopped = False
+
+        """Statistics"""
+        self.received = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.watchdog_trips = 0
+        self.jitter = deque(maxlen=self.WINDOW)
+
+        self.worker = Thread(target=self.loop, daemon=True)
+
+    def start(self):
+        if not self.worker.is_alive():
+            self.worker.start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+        if self.worker.is_alive():
+            self.worker.join(1)
+
+    def enable(self):
+        """Starts sending (after takeoff)"""
+        self.enabled = True
+
+    def disable(self):
+        """Stops sending (before landing), the setpoint is forgotten"""
+        with self.lock:
+            self.enabled = False
+            self.setpoint = None
+            self.unsent = False
+            self.zeros_left = 0
+
+    def set_setpoint(self, left_right_velocity, forward_backward_velocity, up_down_velocity, yaw_velocity):
+        """Arguments: velocities -100~100"""
+        with self.lock:
+            if self.unsent:
+                self.coalesced += 1
+            self.setpoint = (left_right_velocity, forward_backward_velocity, up_down_velocity, yaw_velocity)
+            self.setpoint_time = perf_counter()
+            self.unsent = True
+            self.zeros_left = 0
+            self.received += 1
+
+    def next_command(self):
+        """Returns: velocities to send on this tick or None"""
+        with self.lock:
+            if not self.enabled:
+                return None
+            if self.setpoint is not None:
+                if perf_counter() - self.setpoint_time <= self.stale_timeout:
+                    self.unsent = False
+                    return self.setpoint
+                self.watchdog_trips += 1
+                if self.unsent:
+                    self.dropped += 1
+                self.setpoint = None
+                self.unsent = False
+                self.zeros_left = self.WATCHDOG_REPEATS
+            if self.zeros_left > 0:
+                self.zeros_left -= 1
+                return 0, 0, 0, 0
+        return None
+
+    def loop(self):
+        next_tick = perf_counter()
+        while not self.stopped:
+            next_tick += self.period
+            delay = next_tick - perf_counter()
+            if delay > 0:
+                sleep(delay)
+            else:
+                next_tick = perf_counter()
+            command = self.next_command()
+            if command is None:
+                continue
+            self.jitter.append(perf_counter() - next_tick)
+            METRICS.observe("rc_jitter", abs(self.jitter[-1]))
+            try:
+                with METRICS.timer("rc_send"):
+                    self.tello.move_with_velocities_without_waiting(*command)
+                self.sent += 1
+            except OSError:
+                self.dropped += 1
+                METRICS.inc("rc_send_errors")
+
+    def stats(self):
+        jitter = sorted(abs(v) for v in self.jitter)
+        return {"received": self.received,
+                "sent": self.sent,
+                "coalesced": self.coalesced,
+                "dropped": self.dropped,
+                "watchdog_trips": self.watchdog_trips,
+                "mean_jitter": sum(jitter) / len(jitter) if jitter else None,
+                "p95_jitter": jitter[min(len(jitter) - 1, int(len(jitter) * 0.95))] if jitter else None,
+                "max_jitter": jitter[-1] if jitter else None}
@@ -1,20 +1,34 @@
 from udp_client import UDPClient
+from metrics import METRICS
+from async_udp_client import AsyncUDPClient
+from tello_state import TelloStateListener
 from udp_capturing_server import UDPCapturingServer
 from time import time, sleep
 
 
 class Tello:
     """Constants"""
+    HOST = "192.168.10.1"
+    COMMAND_PORT = 8889
+    VIDEO_ADDRESS = ('0.0.0.0', 11111)
+    STATE_ADDRESS = ('0.0.0.0', 8890)
+    STATE_MAX_AGE = 0.5  # cached state older than this (s) is not used by getters
     ATTEMPT_NUMBERS = 3
     TIMEOUT = 0.1
     FLYING_TIMEOUT = 20
     TIME_BTW_RC_CONTROL_COMMANDS = 0.1
 
-    def __init__(self):
-        self.server = UDPCapturingServer()
-        self.pilot = UDPClient()
-
-        self.cap = self.server.get_video_capture()
+    def __init__(self, host=HOST, command_port=COMMAND_PORT, video_address=VIDEO_ADDRESS, video_backend="opencv"):
+        """Arguments: host: drone ip address (127.0.0.1 for the local simulator), command_port: drone command port,
+        video_address: local address to receive video at, video_backend: "opencv" or "nal" (see video_ingest)"""
+        self.host = host
+        self.server = UDPCapturingServer(video_address, host, video_backend)
+        # A lost response raises socket.timeout instead of blocking forever, moves are answered after the move
+        self.pilot = UDPClient((host, command_port), timeout=self.FLYING_TIMEOUT)
+        self.async_pilot = AsyncUDPClient((host, command_port))
+        self.state_listener = None
+
+        # The video capture is opened on first use, by open_video() or the background frame reading
         self.stream_on = False
 
         self.last_command_time = time()
@@ -53,11 +67,22 @@ class Tello:
         """Call this method when you want to end the tello object"""
         if self.stream_on:
             self.streamoff()
+        self.server.stop_background_read()
+        self.stop_state_listener()
         if self.cap is not None:
             self.cap.release()
 
     """Video streaming"""
 
+    @property
+    def cap(self):
+        """Video capture or None if it was not opened yet"""
+        return self.server.cap
+
+    def open_video(self):
+        """Opens the video capture. Returns: the video ingest"""
+        return self.server.get_video_capture()
+
     def streamon(self):
         self.last_command_time = time()
         resp = self.pilot.send_message_with_response("streamon")
@@ -80,6 +105,19 @@ class Tello:
         resp = self.pilot.send_message_with_response("land")
         return resp == "ok"
 
+    def send_on_new_socket(self, command):
+        """Sends COMMAND from a new socket and waits for its response there, so it does not wait behind
+        a command still waiting for its response on the main one and takes none of its responses.
+        Returns: bool: True for successful, False for unsuccessful"""
+        self.last_command_time = time()
+        client = UDPClient(self.pilot.server, timeout=self.FLYING_TIMEOUT)
+        try:
+            return client.send_message_with_response(command) == "ok"
+        except OSError:
+            return False
+        finally:
+            client.close()
+
     def stop(self):
         self.last_command_time = time()
         resp = self.move_with_velocities_without_waiting(0, 0, 0, 0)
@@ -197,7 +235,7 @@ class Tello:
         up_down_velocity: -100~100 (up/down), yaw_velocity: -100~100 (yaw)
         Returns: bool: True for successful, False for unsuccessful"""
         if time() - self.last_command_time < self.TIME_BTW_RC_CONTROL_COMMANDS:
-            pass
+            METRICS.inc("rc_rate_limited")  # the command is dropped
         else:
             self.last_command_time = time()
             resp = self.pilot.send_message(
@@ -214,6 +252,34 @@ class Tello:
             f'rc {left_right_velocity} {forward_backward_velocity} {up_down_velocity} {yaw_velocity}')
         return resp == "ok"
 
+    """State"""
+
+    def start_state_listener(self, address=STATE_ADDRESS):
+        """Starts receiving state packets, getters answer from them without round trips to the drone"""
+        if self.state_listener is None:
+            self.state_listener = TelloStateListener(address).start()
+        return self.state_listener
+
+    def stop_state_listener(self):
+        if self.state_listener is not None:
+            self.state_listener.stop()
+            self.state_listener = None
+
+    def latest_state(self):
+        """Returns: the last state record or None"""
+        if self.state_listener is None:
+            return None
+        return self.state_listener.latest_state()
+
+    def cached_state(self):
+        """Returns: the last state record if it is fresh enough to answer getters, None otherwise"""
+        if self.state_listener is None:
+            return None
+        age = self.state_listener.age()
+        if age is None or age > self.STATE_MAX_AGE:
+            return None
+        return self.state_listener.latest_state()
+
     """Info"""
 
     def get_speed(self):
@@ -222,12 +288,19 @@ class Tello:
         return self.pilot.send_message_with_response('speed?')
 
     def get_battery(self):
-        """Get current battery percentage. Returns: False: Unsuccessful; int: -100"""
+        """Get current battery percentage. Returns: False: Unsuccessful; int: -100.
+        Answers from state packets without a round trip if the state listener is running (as for the getters below)"""
+        state = self.cached_state()
+        if state is not None:
+            return int(state['bat'])
         self.last_command_time = time()
         return self.pilot.send_message_with_response('battery?')
 
     def get_flight_time(self):
         """Get current fly time (s). Returns: False: Unsuccessful; int: Seconds elapsed during flight."""
+        state = self.cached_state()
+        if state is not None:
+            return int(state['time'])
         self.last_command_time = time()
         return self.pilot.send_message_with_response('time?')
 
@@ -238,38 +311,100 @@ class Tello:
 
     def get_baro(self):
         """Get current barometer value (m). Returns: False: Unsuccessful; float number."""
+        state = self.cached_state()
+        if state is not None:
+            return round(float(state['baro']), 2)
         self.last_command_time = time()
         return self.pilot.send_message_with_response('baro?')
 
     def get_attitude(self):
         """Get IMU attitude data
         Returns: False: Unsuccessful; int: pitch roll yaw"""
+        state = self.cached_state()
+        if state is not None:
+            return int(state['pitch']), int(state['roll']), int(state['yaw'])
         self.last_command_time = time()
         return self.pilot.send_message_with_response('attitude?')
 
     def get_height(self):
         """Get height (cm)
         Returns: False: Unsuccessful; int: 0-3000"""
+        state = self.cached_state()
+        if state is not None:
+            return int(state['h'])
         self.last_command_time = time()
         return self.pilot.send_message_with_response('height?')
 
+    """Awaitable API (lost responses are retried, see AsyncUDPClient)"""
+
+    async def send_command_async(self, command, timeout=None, retries=None):
+        """Returns: response or None if there was no valid response"""
+        self.last_command_time = time()
+        return await self.async_pilot.send_command(command, timeout, retries)
+
+    async def try_to_send_command_async(self, command):
+        """Returns: bool: True for successful, False for unsuccessful"""
+        return await self.send_command_async(command) == "ok"
+
+    async def connect_async(self):
+        return await self.try_to_send_command_async("command")
+
+    async def set_speed_async(self, x):
+        return await self.try_to_send_command_async("speed " + str(x))
+
+    async def streamon_async(self):
+        self.stream_on = await self.try_to_send_command_async("streamon")
+        return self.stream_on
+
+    async def streamoff_async(self):
+        result = await self.try_to_send_command_async("streamoff")
+        if result:
+            self.stream_on = False
+        return result
+
+    async def takeoff_async(self):
+        return await self.try_to_send_command_async("takeoff")
+
+    async def land_async(self):
+        return await self.try_to_send_command_async("land")
+
+    async def move_async(self, direction, x):
+        """Arguments: direction: up, down, left, right, forward or back, x: 20-500"""
+        return await self.try_to_send_command_async(direction + ' ' + str(x))
+
+    async def rotate_cw_async(self, x):
+        return await self.try_to_send_command_async("cw " + str(x))
+
+    async def rotate_ccw_async(self, x):
+        return await self.try_to_send_command_async("ccw " + str(x))
+
+    async def move_with_velocities_async(self, left_right_velocity, forward_backward_velocity, up_down_velocity,
+                                         yaw_velocity):
+        """Send RC control via four channels without waiting for response"""
+        await self.async_pilot.connect()
+        self.last_command_time = time()
+        self.async_pilot.send_nowait(
+            f'rc {left_right_velocity} {forward_backward_velocity} {up_down_velocity} {yaw_velocity}')
+
+    async def get_async(self, name):
+        """Asks drone for the value: speed, battery, time, wifi, baro, attitude, height, temp or tof.
+        Returns: response or None"""
+        return await self.send_command_async(name + "?")
+
 
 def main():
     import cv2
     t = Tello()
-    print(t.cap)
     r = t.connect()
     print(r)
     r = t.streamon()
-    res = False
-    frame = None
+    print(t.open_video())
+    t.server.start_background_read()
+    seq = 0
     while True:
-        try:
-            cap = t.server.get_video_capture()
-            res, frame = cap.read()
-        except ValueError:
-            pass
-        if res and frame is not None:
+        latest = t.server.latest_frame()
+        if latest is not None and latest[0] > seq:
+            seq, _, frame = latest
             cv2.imshow("drone", frame)
             print(f"Frame is: {frame}")
             print(f"Shape is: {frame.shape}")
@@ -0,0 +1,420 @@
+import random
+import socket
+from queue import Queue, Empty
+from threading import Thread, Timer, Lock
+from time import time, sleep, perf_counter
+import numpy as np
+
+
+"""Frame marker: frame index drawn as black/white blocks in the top left corner to measure glass-to-glass latency"""
+
+MARKER_BITS = 16
+MARKER_BLOCK = 24
+
+
+def draw_frame_marker(frame, index):
+    for bit in range(MARKER_BITS):
+        value = 255 if (index >> bit) & 1 else 0
+        frame[0:MARKER_BLOCK, bit * MARKER_BLOCK:(bit + 1) * MARKER_BLOCK] = value
+    return frame
+
+
+def read_frame_marker(frame):
+    """Returns: frame index drawn by draw_frame_marker"""
+    index = 0
+    half = MARKER_BLOCK // 2
+    for bit in range(MARKER_BITS):
+        block = frame[half // 2:half // 2 + half, bit * MARKER_BLOCK + half // 2:bit * MARKER_BLOCK + half // 2 + half]
+        if block.mean() > 127:
+            index |= 1 << bit
+    return index
+
+
+def split_nal_units(data):
+    """Splits Annex B H.264 byte stream into NAL units (with start codes)"""
+    starts = []
+    i = data.find(b'\x00\x00\x01')
+    while i >= 0:
+        start = i - 1 if i > 0 and data[i - 1] == 0 else i
+        starts.append((start, i + 3))
+        i = data.find(b'\x00\x00\x01', i + 3)
+    return [data[start:starts[k + 1][0] if k + 1 < len(starts) else len(data)] for k, (start, _) in enumerate(starts)]
+
+
+def nal_type(nal):
+    header = nal.find(b'\x00\x00\x01') + 3
+    return nal[header] & 0x1f if header < len(nal) else None
+
+
+def split_access_units(data):
+    """Groups NAL units into access units, every access unit ends with a slice (NAL type 1 or 5)"""
+    units, current = [], []
+    for nal in split_nal_units(data):
+        current.append(nal)
+        if nal_type(nal) in (1, 5):
+            units.append(b''.join(current))
+            current = []
+    return units
+
+
+class H264FileSource:
+    """Raw Annex B .h264 file played in a loop"""
+
+    def __init__(self, path, fps=30):
+        with open(path, 'rb') as f:
+            self.access_units = split_access_units(f.read())
+        if not self.access_units:
+            raise ValueError(f"No H.264 access units found in {path}")
+        self.fps = fps
+        self.index = 0
+
+    def next_access_unit(self):
+        """Returns: (frame index or None if the frame has no marker, access unit bytes)"""
+        unit = self.access_units[self.index % len(self.access_units)]
+        self.index += 1
+        return None, unit
+
+
+class SyntheticH264Source:
+    """Synthetic frames with a moving square and frame index marker, encoded with libx264 (requires PyAV)"""
+
+    def __init__(self, width=960, height=720, fps=30, gop=30):
+        try:
+            import av
+        except ImportError:
+            raise ImportError("SyntheticH264Source requires PyAV: pip install av")
+        self.av = av
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.encoder = av.CodecContext.create('libx264', 'w')
+        self.encoder.width = width
+        self.encoder.height = height
+        self.encoder.pix_fmt = 'yuv420p'
+        self.encoder.framerate = fps
+        self.encoder.gop_size = gop
+        self.encoder.options = {"preset": "ultrafast", "tune": "zerolatency", "x264-params": "repeat-headers=1"}
+        self.background = np.tile(np.linspace(40, 200, width, dtype=np.uint8)[None, :, None], (height, 1, 3))
+        self.index = 0
+
+    def make_frame(self, index):
+        frame = self.background.copy()
+        x = (index * 8) % (self.width - 120)
+        frame[self.height // 2 - 60:self.height // 2 + 60, x:x + 120] = (50, 180, 220)
+        return draw_frame_marker(frame, index)
+
+    def next_access_unit(self):
+        """Returns: (frame index, access unit bytes)"""
+        index = self.index
+        self.index += 1
+        frame = self.av.VideoFrame.from_ndarray(self.make_frame(index % (1 << MARKER_BITS)), format='bgr24')
+        frame.pts = index
+        packets = self.encoder.encode(frame)
+        return index % (1 << MARKER_BITS), b''.join(bytes(packet) for packet in packets)
+
+
+class TelloSimulator:
+    """Local stand-in for the drone. Answers SDK commands on the command port, pushes state packets
+    to the client state port and streams H.264 to the client video port.
+    Response latency, packet loss and command processing time are configurable"""
+
+    """Constants"""
+    STATE_PERIOD = 0.1
+    PACKET_SIZE = 1460
+    TAKEOFF_HEIGHT = 80
+
+    def __init__(self, host="127.0.0.1", command_port=8889, state_port=8890, video_port=11111, video_source=None,
+                 response_latency=0.0, packet_loss=0.0, processing_time=0.0, move_speed=None, stream_on=False,
+                 seed=None):
+        """Arguments: host, command_port: address to listen for commands at, state_port, video_port: client ports,
+        video_source: H264FileSource or SyntheticH264Source, response_latency: one-way delay of responses (s),
+        packet_loss: 0-1 probability to lose a command or a response, processing_time: command execution time (s),
+        move_speed: cm/s to add distance / speed to move commands time (None to ignore distance),
+        stream_on: start with the video stream already on"""
+        self.address = (host, command_port)
+        self.state_port = state_port
+        self.video_port = video_port
+        self.video_source = video_source
+        self.response_latency = response_latency
+        self.packet_loss = packet_loss
+        self.processing_time = processing_time
+        self.move_speed = move_speed
+        self.stream_on = stream_on
+        self.random = random.Random(seed)
+
+        self.command_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.command_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.command_socket.bind(self.address)
+        self.command_socket.settimeout(0.2)
+        self.out_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+        self.client = None
+        self.commands = Queue()
+        self.state = {"pitch": 0, "roll": 0, "yaw": 0, "vgx": 0, "vgy": 0, "vgz": 0, "templ": 60, "temph": 63,
+                      "tof": 10, "h": 0, "bat": 100, "baro": 0.0, "time": 0, "agx": 0.0, "agy": 0.0, "agz": -1000.0}
+        self.speed = 100
+        self.rc = (0, 0, 0, 0)
+        self.flying = False
+        self.takeoff_time = None
+        self.state_lock = Lock()
+
+        """Statistics"""
+        self.frame_send_times = {}
+        self.received_commands = 0
+        self.lost_commands = 0
+        self.lost_responses = 0
+        self.sent_frames = 0
+
+        self.stopped = False
+        self.workers = [Thread(target=self.receive_commands, daemon=True),
+                        Thread(target=self.execute_commands, daemon=True),
+                        Thread(target=self.send_state, daemon=True),
+                        Thread(target=self.send_video, daemon=True)]
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+        for worker in self.workers:
+            worker.join(1)
+        self.command_socket.close()
+        self.out_socket.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def lost(self):
+        return self.packet_loss > 0 and self.random.random() < self.packet_loss
+
+    """Commands"""
+
+    def receive_commands(self):
+        while not self.stopped:
+            try:
+                data, address = self.command_socket.recvfrom(1024)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.client = address
+            self.received_commands += 1
+            if self.lost():
+                self.lost_commands += 1
+                continue
+            command = data.decode('utf-8', errors='replace').strip()
+            if command.startswith("rc "):
+                self.set_rc(command)
+            else:
+                self.commands.put((command, address))
+
+    def execute_commands(self):
+        """Commands are executed one after another as the drone does"""
+        while not self.stopped:
+            try:
+                command, address = self.commands.get(timeout=0.2)
+            except Empty:
+                continue
+            duration = self.command_duration(command)
+            if duration > 0:
+                sleep(duration)
+            self.respond(self.handle_command(command), address)
+
+    def command_duration(self, command):
+        parts = command.split()
+        duration = self.processing_time
+        if self.move_speed and len(parts) == 2 and parts[0] in ("up", "down", "left", "right", "forward", "back"):
+            duration += int(parts[1]) / self.move_speed
+        return duration
+
+    def respond(self, response, address):
+        if response is None:
+            return
+        if self.lost():
+            self.lost_responses += 1
+            return
+        data = response.encode('utf-8')
+        if self.response_latency > 0:
+            Timer(self.response_latency, self.send_to, (data, address)).start()
+        else:
+            self.send_to(data, address)
+
+    def send_to(self, data, address):
+        try:
+            self.command_socket.sendto(data, address)
+        except OSError:
+            pass
+
+    def set_rc(self, command):
+        try:
+            self.rc = tuple(int(v) for v in command.split()[1:5])
+        except ValueError:
+            pass
+
+    def handle_command(self, command):
+        """Returns: response to the SDK command"""
+        parts = command.split()
+        if not parts:
+            return "error"
+        name, arguments = parts[0], parts[1:]
+        with self.state_lock:
+            if name == "command":
+                return "ok"
+            if name == "streamon":
+                self.stream_on = True
+                return "ok"
+            if name == "streamoff":
+                self.stream_on = False
+                return "ok"
+            if name == "takeoff":
+                self.flying = True
+                self.takeoff_time = time()
+                self.state["h"] = self.TAKEOFF_HEIGHT
+                return "ok"
+            if name in ("land", "emergency"):
+                self.flying = False
+                self.state["h"] = 0
+                return "ok"
+            if name == "port" and len(arguments) == 2:  # SDK 2.0: state and video ports
+                self.state_port, self.video_port = int(arguments[0]), int(arguments[1])
+                return "ok"
+            if name == "speed" and arguments:
+                self.speed = int(arguments[0])
+                return "ok"
+            if name in ("up", "down") and arguments:
+                if not self.flying:
+                    return "error Not joystick"
+                self.state["h"] = max(0, self.state["h"] + (1 if name == "up" else -1) * int(arguments[0]))
+                return "ok"
+            if name in ("cw", "ccw") and arguments:
+                if not self.flying:
+                    return "error Not joystick"
+                self.state["yaw"] = (self.state["yaw"] + (1 if name == "cw" else -1) * int(arguments[0]) + 180) % 360 - 180
+                return "ok"
+            if name in ("left", "right", "forward", "back", "flip", "go", "curve", "stop", "wifi"):
+                return "ok" if self.flying or name == "wifi" else "error Not joystick"
+            if name.endswith("?"):
+                return self.query(name[:-1])
+        return "error"
+
+    def query(self, name):
+        state = self.state
+        answers = {"speed": str(self.speed),
+                   "battery": str(state["bat"]),
+                   "time": f"{self.flight_time()}s",
+                   "wifi": "90",
+                   "baro": f"{state['baro']:.2f}",
+                   "attitude": f"pitch:{state['pitch']};roll:{state['roll']};yaw:{state['yaw']};",
+                   "height": f"{state['h'] // 10}dm",
+                   "temp": f"{state['templ']}~{state['temph']}C",
+                   "tof": f"{state['tof']}mm"}
+        return answers.get(name, "error")
+
+    def flight_time(self):
+        return int(time() - self.takeoff_time) if self.flying and self.takeoff_time is not None else 0
+
+    """State"""
+
+    def state_message(self):
+        with self.state_lock:
+            state = dict(self.state)
+        state["time"] = self.flight_time()
+        state["baro"] = state["h"] / 100
+        return ("pitch:%d;roll:%d;yaw:%d;vgx:%d;vgy:%d;vgz:%d;templ:%d;temph:%d;tof:%d;h:%d;bat:%d;baro:%.2f;"
+                "time:%d;agx:%.2f;agy:%.2f;agz:%.2f;\r\n" % tuple(state[k] for k in (
+                    "pitch", "roll", "yaw", "vgx", "vgy", "vgz", "templ", "temph", "tof", "h", "bat", "baro",
+                    "time", "agx", "agy", "agz")))
+
+    def send_state(self):
+        while not self.stopped:
+            if self.client is not None:
+                try:
+                    self.out_socket.sendto(self.state_message().encode('utf-8'), (self.client[0], self.state_port))
+                except OSError:
+                    pass
+            sleep(self.STATE_PERIOD)
+
+    """Video"""
+
+    def send_video(self):
+        if self.video_source is None:
+            return
+        period = 1 / self.video_source.fps
+        next_frame = perf_counter()
+        while not self.stopped:
+            next_frame += period
+            if self.stream_on:
+                index, unit = self.video_source.next_access_unit()
+                host = self.client[0] if self.client is not None else self.address[0]
+                if index is not None:
+                    self.frame_send_times[index] = time()
+                for offset in range(0, len(unit), self.PACKET_SIZE):
+                    if self.lost():
+                        continue
+                    try:
+                        self.out_socket.sendto(unit[offset:offset + self.PACKET_SIZE], (host, self.video_port))
+                    except OSError:
+                        pass
+                self.sent_frames += 1
+            delay = next_frame - perf_counter()
+            if delay > 0:
+                sleep(delay)
+            else:
+                next_frame = perf_counter()
+
+
+def percentiles(values):
+    if not values:
+        return "no samples"
+    p50, p95, p99 = np.percentile(np.asarray(values) * 1000, [50, 95, 99])
+    return f"p50 {p50:.1f} ms, p95 {p95:.1f} ms, p99 {p99:.1f} ms ({len(values)} samples)"
+
+
+def main():
+    """Measures command round trip and glass-to-glass latency against the local simulator"""
+    import sys
+    from tello import Tello
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else 0.0
+    loss = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    source = H264FileSource(sys.argv[3]) if len(sys.argv) > 3 else SyntheticH264Source()
+    with TelloSimulator(video_source=source, response_latency=latency, packet_loss=loss, stream_on=True) as sim:
+        tello = Tello("127.0.0.1")
+        tello.pilot.udp_client_socket.settimeout(1)
+
+        round_trips = []
+        for _ in range(50):
+            start = perf_counter()
+            try:
+                if tello.pilot.send_message_with_response("command") == "ok":
+                    round_trips.append(perf_counter() - start)
+            except socket.timeout:
+                pass
+        print("Command round trip:", percentiles(round_trips))
+
+        tello.streamon()
+        server = tello.server
+        server.start_background_read()
+        glass_to_glass = []
+        seq = 0
+        deadline = perf_counter() + 10
+        while perf_counter() < deadline and len(glass_to_glass) < 200:
+            latest = server.wait_for_newer(seq, 1)
+            if latest is None:
+                continue
+            seq, timestamp, frame = latest
+            sent = sim.frame_send_times.get(read_frame_marker(frame))
+            if sent is not None and 0 <= timestamp - sent < 5:
+                glass_to_glass.append(timestamp - sent)
+        print("Glass-to-glass:", percentiles(glass_to_glass))
+        print(f"Frames sent: {sim.sent_frames}, received: {seq}, "
+              f"lost commands: {sim.lost_commands}, lost responses: {sim.lost_responses}")
+        tello.end()
+
+
+if __name__ == "__main__":
+    main()
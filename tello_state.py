@@ -0,0 +1,138 @@
+import socket
+from threading import Thread, Lock
+from time import time
+import numpy as np
+
+
+"""State packet: "pitch:%d;roll:%d;yaw:%d;vgx:%d;vgy:%d;vgz:%d;templ:%d;temph:%d;tof:%d;h:%d;bat:%d;baro:%.2f;
+time:%d;agx:%.2f;agy:%.2f;agz:%.2f;\\r\\n", SDK 2.0 adds mission pad fields mid, x, y, z, mpry"""
+
+STATE_DTYPE = np.dtype([("timestamp", np.float64),
+                        ("pitch", np.int16), ("roll", np.int16), ("yaw", np.int16),
+                        ("vgx", np.int16), ("vgy", np.int16), ("vgz", np.int16),
+                        ("templ", np.int16), ("temph", np.int16),
+                        ("tof", np.int32), ("h", np.int32), ("bat", np.int16), ("baro", np.float32),
+                        ("time", np.int32),
+                        ("agx", np.float32), ("agy", np.float32), ("agz", np.float32),
+                        ("mid", np.int16), ("x", np.int16), ("y", np.int16), ("z", np.int16)])
+
+FIELD_NAMES = {name.encode('ascii'): name for name in STATE_DTYPE.names if name != "timestamp"}
+
+
+class TelloStateListener:
+    """Receives state packets the drone pushes to port 8890 (~10 Hz) in a background thread
+    and keeps them in a preallocated structured NumPy ring buffer"""
+
+    """Constants"""
+    CAPACITY = 1024  # ~100 s of state at 10 Hz
+    BUFFER_SIZE = 1024
+
+    def __init__(self, address=('0.0.0.0', 8890), capacity=CAPACITY):
+        self.address = address
+        self.ring = np.zeros(capacity, dtype=STATE_DTYPE)
+        self.ring["mid"] = -1
+        self.capacity = capacity
+        self.count = 0
+        self.lock = Lock()
+        self.buffer = bytearray(self.BUFFER_SIZE)
+        self.view = memoryview(self.buffer)
+
+        """Statistics"""
+        self.packets = 0
+        self.parse_errors = 0
+
+        self.socket = None
+        self.stopped = False
+        self.worker = Thread(target=self.receive, daemon=True)
+
+    def start(self):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(self.address)
+        self.socket.settimeout(0.5)
+        self.worker.start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+        if self.worker.is_alive():
+            self.worker.join(1)
+        if self.socket is not None:
+            self.socket.close()
+
+    def receive(self):
+        while not self.stopped:
+            try:
+                size = self.socket.recv_into(self.buffer)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.packets += 1
+            self.parse(self.view[:size], time())
+
+    def parse(self, data, timestamp):
+        """Parses the packet straight into the next ring slot. Returns: bool: True if the packet was parsed"""
+        slot = self.count % self.capacity
+        ring = self.ring
+        try:
+            for field in bytes(data).rstrip(b"\r\n;").split(b";"):
+                key, _, value = field.partition(b":")
+                name = FIELD_NAMES.get(key)
+                if name is not None:
+                    ring[name][slot] = float(value)
+        except ValueError:
+            self.parse_errors += 1
+            return False
+        ring["timestamp"][slot] = timestamp
+        with self.lock:
+            self.count += 1
+        return True
+
+    def latest_state(self):
+        """Returns: the last state record (copy) or None if there was no packet yet"""
+        with self.lock:
+            if self.count == 0:
+                return None
+            return self.ring[(self.count - 1) % self.capacity].copy()
+
+    def age(self):
+        """Seconds since the last state packet or None"""
+        with self.lock:
+            if self.count == 0:
+                return None
+            return time() - self.ring["timestamp"][(self.count - 1) % self.capacity]
+
+    def history(self, seconds=None, count=None):
+        """Returns: state records in chronological order (copy), the last COUNT ones or the ones of the last SECONDS"""
+        with self.lock:
+            available = min(self.count, self.capacity)
+            end = self.count % self.capacity
+            if available < self.capacity:
+                records = self.ring[:available].copy()
+            else:
+                records = np.concatenate((self.ring[end:], self.ring[:end]))
+        if seconds is not None:
+            records = records[records["timestamp"] >= time() - seconds]
+        if count is not None:
+            records = records[-count:] if count > 0 else records[:0]
+        return records
+
+
+def main():
+    listener = TelloStateListener().start()
+    from time import sleep
+    try:
+        while True:
+            sleep(1)
+            state = listener.latest_state()
+            if state is not None:
+                window = listener.history(seconds=5)
+                print(f"bat {state['bat']}%, h {state['h']} cm, yaw {state['yaw']}, "
+                      f"mean h over 5 s {window['h'].mean():.1f} cm, {listener.packets} packets")
+    except KeyboardInterrupt:
+        listener.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+from cv2 import matchTemplate, minMaxLoc, TM_CCOEFF_NORMED
+
+
+class TemplateTracker:
+    """Cheap inter-frame face tracker. Looks for the face template from the last detection
+    in a window around the last face position"""
+
+    """Constants"""
+    SEARCH_EXPANSION = 0.5  # search window margin around the last box in face sizes
+    MIN_SCORE = 0.6  # the track is lost if the best normalized correlation is lower
+
+    def __init__(self, search_expansion=SEARCH_EXPANSION, min_score=MIN_SCORE):
+        self.search_expansion = search_expansion
+        self.min_score = min_score
+        self.template = None
+        self.box = None
+        self.score = None
+
+    def init(self, img_gray, box):
+        """Takes template of the BOX (x, y, w, h) from the gray image"""
+        (x, y, w, h) = (int(v) for v in box)
+        self.template = img_gray[y:y + h, x:x + w].copy()
+        self.box = (x, y, w, h)
+        self.score = 1.0
+
+    def reset(self):
+        self.template = None
+        self.box = None
+        self.score = None
+
+    def update(self, img_gray):
+        """Returns: new face box (x, y, w, h) or None if the track is lost"""
+        if self.template is None:
+            return None
+        (x, y, w, h) = self.box
+        margin_x, margin_y = int(w * self.search_expansion), int(h * self.search_expansion)
+        x0, y0 = max(0, x - margin_x), max(0, y - margin_y)
+        x1, y1 = min(img_gray.shape[1], x + w + margin_x), min(img_gray.shape[0], y + h + margin_y)
+        if x1 - x0 < w or y1 - y0 < h:
+            self.reset()
+            return None
+        scores = matchTemplate(img_gray[y0:y1, x0:x1], self.template, TM_CCOEFF_NORMED)
+        _, score, _, (best_x, best_y) = minMaxLoc(scores)
+        self.score = score
+        if score < self.min_score:
+            self.reset()
+            return None
+        self.box = (x0 + best_x, y0 + best_y, w, h)
+        return self.box
@@ -0,0 +1,228 @@
+from math import copysign
+
+
+class PID:
+    """PID loop with output and integral limits"""
+
+    def __init__(self, kp, ki=0.0, kd=0.0, output_limit=100, integral_limit=None):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.output_limit = output_limit
+        self.integral_limit = integral_limit
+        self.integral = 0.0
+        self.previous_error = None
+
+    def reset(self):
+        self.integral = 0.0
+        self.previous_error = None
+
+    def update(self, error, dt):
+        self.integral += error * dt
+        if self.integral_limit is not None:
+            self.integral = max(-self.integral_limit, min(self.integral_limit, self.integral))
+        derivative = 0.0
+        if self.previous_error is not None and dt > 0:
+            derivative = (error - self.previous_error) / dt
+        self.previous_error = error
+        output = self.kp * error + self.ki * self.integral + self.kd * derivative
+        return max(-self.output_limit, min(self.output_limit, output))
+
+
+class DiscreteController:
+    """The original FaceTracker control: fixed speeds from the {-1, 0, 1} directions vector,
+    forward/backward only when the face is centred, velocities are kept between updates"""
+
+    def __init__(self, lr_s, ud_s, fb_s, cw_s, velocities=(0, 0, 0, 0)):
+        """Arguments: fixed speeds, initial velocities (left_right, for_back, up_down, yaw)"""
+        self.lr_s, self.ud_s, self.fb_s, self.cw_s = lr_s, ud_s, fb_s, cw_s
+        self.left_right_velocity, self.for_back_velocity, self.up_down_velocity, self.yaw_velocity = velocities
+
+    def reset(self):
+        pass
+
+    def update(self, vec, pixel_vector, t):
+        """Arguments: vec: directions vector or None, pixel_vector: not used, t: time (s)
+        Returns: (left_right, for_back, up_down, yaw) velocities"""
+        if vec is None:
+            vec = [0, 0, 0]
+        """Setting velocities depending from directions vector VEC"""
+        if vec[0] != 0 or vec[1] != 0:
+            """Moving in 2D space at first"""
+            self.left_right_velocity = -self.lr_s * vec[0]
+            self.up_down_velocity = self.ud_s * vec[1]
+        else:
+            """Then moving forward/backward"""
+            self.for_back_velocity = self.fb_s * vec[2]
+            self.yaw_velocity = self.cw_s * 0
+        return self.left_right_velocity, self.for_back_velocity, self.up_down_velocity, self.yaw_velocity
+
+
+class PIDController:
+    """Continuous control of all axes at once from the raw pixel offset and face square ratio.
+    Horizontal offset drives yaw and left/right, vertical offset drives up/down,
+    face square ratio error drives forward/backward"""
+
+    def __init__(self, width, height, target_square_ratio, lr_s, ud_s, fb_s, cw_s,
+                 lr_gains=(0.0, 0.0, 0.0), ud_gains=(1.2, 0.1, 0.15), fb_gains=(0.8, 0.05, 0.1),
+                 yaw_gains=(1.5, 0.1, 0.2)):
+        """Arguments: frame size, target face to frame square ratio, speed limits of the axes,
+        (kp, ki, kd) gains on normalised errors (-1~1), output is a share of the axis speed limit"""
+        self.half_width = width / 2
+        self.half_height = height / 2
+        self.target_square_ratio = target_square_ratio
+        self.limits = (lr_s, fb_s, ud_s, cw_s)
+        self.lr = PID(*lr_gains, output_limit=1.0, integral_limit=1.0)
+        self.ud = PID(*ud_gains, output_limit=1.0, integral_limit=1.0)
+        self.fb = PID(*fb_gains, output_limit=1.0, integral_limit=1.0)
+        self.yaw = PID(*yaw_gains, output_limit=1.0, integral_limit=1.0)
+        self.last_time = None
+
+    def reset(self):
+        for pid in (self.lr, self.ud, self.fb, self.yaw):
+            pid.reset()
+        self.last_time = None
+
+    def update(self, vec, pixel_vector, t):
+        """Arguments: vec: not used, pixel_vector: (dx, dy, square_ratio) from FaceVector.pixel_vector_3d or None,
+        t: time (s). Returns: (left_right, for_back, up_down, yaw) velocities"""
+        if pixel_vector is None:
+            self.reset()
+            return 0, 0, 0, 0
+        dt = t - self.last_time if self.last_time is not None else 0.0
+        self.last_time = t
+        dx, dy, square_ratio = pixel_vector
+        error_x = dx / self.half_width  # > 0: the face is to the left of the centre
+        error_y = dy / self.half_height  # > 0: the face is above the centre
+        error_z = (self.target_square_ratio - square_ratio) / self.target_square_ratio  # > 0: the face is too far
+        lr_s, fb_s, ud_s, cw_s = self.limits
+        return (int(round(-lr_s * self.lr.update(error_x, dt))),
+                int(round(fb_s * self.fb.update(error_z, dt))),
+                int(round(ud_s * self.ud.update(error_y, dt))),
+                int(round(-cw_s * self.yaw.update(error_x, dt))))
+
+
+class SettleMetrics:
+    """Time-to-centre and overshoot of centring episodes.
+    An episode starts when the face leaves the centre region and ends when it stays inside for settle_time"""
+
+    def __init__(self, region_x, region_y, settle_time=0.5):
+        """Arguments: region_x, region_y: centre region half size (pixels), settle_time: seconds"""
+        self.region_x = region_x
+        self.region_y = region_y
+        self.settle_time = settle_time
+        self.episodes = []
+        self.start = None
+        self.initial = None
+        self.overshoot = 0.0
+        self.inside_since = None
+
+    def centred(self, dx, dy):
+        return abs(dx) < self.region_x and abs(dy) < self.region_y
+
+    def update(self, pixel_vector, t):
+        """Arguments: pixel_vector: (dx, dy, square_ratio) or None when there is no face, t: time (s)"""
+        if pixel_vector is None:
+            return
+        dx, dy, _ = pixel_vector
+        if self.start is None:
+            if not self.centred(dx, dy):
+                self.start = t
+                self.initial = (dx, dy)
+                self.overshoot = 0.0
+                self.inside_since = None
+            return
+
+        for error, initial in ((dx, self.initial[0]), (dy, self.initial[1])):
+            if initial != 0 and copysign(1, error) != copysign(1, initial):
+                self.overshoot = max(self.overshoot, abs(error) / abs(initial))
+
+        if self.centred(dx, dy):
+            if self.inside_since is None:
+                self.inside_since = t
+            if t - self.inside_since >= self.settle_time:
+                self.episodes.append({"time_to_centre": self.inside_since - self.start, "overshoot": self.overshoot})
+                self.start = None
+        else:
+            self.inside_since = None
+
+    def summary(self):
+        times = sorted(e["time_to_centre"] for e in self.episodes)
+        overshoots = [e["overshoot"] for e in self.episodes]
+        return {"episodes": len(self.episodes),
+                "unsettled": 1 if self.start is not None else 0,
+                "mean_time_to_centre": sum(times) / len(times) if times else None,
+                "median_time_to_centre": times[len(times) // 2] if times else None,
+                "mean_overshoot": sum(overshoots) / len(overshoots) if overshoots else None,
+                "max_overshoot": max(overshoots) if overshoots else None}
+
+
+def simulate(controller, fv, initial, duration=10.0, fps=20, delay=0.2, gains=(4.0, 3.0, 4.0, 0.03),
+             response=0.3, settle_time=0.5):
+    """Closed loop of CONTROLLER with a simple drone/camera model: the face image offset moves with
+    the velocities (first-order response with RESPONSE time constant), measurements come DELAY seconds late.
+    Arguments: fv: FaceVector for frame geometry and directions vectors, initial: (dx, dy, square_ratio),
+    gains: pixels/s per velocity unit of left_right, yaw, up_down and square ratio growth per forward unit.
+    Returns: SettleMetrics"""
+    metrics = SettleMetrics(fv.width * fv.target_face_region_ratio, fv.height * fv.target_face_region_ratio,
+                            settle_time)
+    controller.reset()
+    dt = 1 / fps
+    dx, dy, ratio = initial
+    velocity = [0.0, 0.0, 0.0, 0.0]
+    history = []
+    steps = int(duration * fps)
+    delay_steps = int(round(delay / dt))
+    k_lr, k_yaw, k_ud, k_fb = gains
+    for step in range(steps):
+        t = step * dt
+        history.append((dx, dy, ratio))
+        measured = history[max(0, len(history) - 1 - delay_steps)]
+        vec = fv.direction_vector_from_face(face_from_pixel_vector(fv, measured))
+        command = controller.update(vec, measured, t)
+        metrics.update((dx, dy, ratio), t)
+        for i in range(4):
+            velocity[i] += (command[i] - velocity[i]) * min(1.0, dt / response)
+        lr, fb, ud, yaw = velocity
+        dx += (k_lr * lr + k_yaw * yaw) * dt
+        dy -= k_ud * ud * dt
+        ratio = max(1e-4, ratio * (1 + k_fb * fb * dt))
+    return metrics
+
+
+def face_from_pixel_vector(fv, pixel_vector):
+    """Face box (x, y, w, h) with the given (dx, dy, square_ratio)"""
+    dx, dy, ratio = pixel_vector
+    side = int((ratio * fv.frame_square) ** 0.5)
+    x_center, y_center = fv.img_center[0] - dx, fv.img_center[1] - dy
+    return int(x_center - side // 2), int(y_center - side // 2), side, side
+
+
+def main():
+    from face_vector import FaceVector
+    from face_tracker import FaceTracker
+    fv = FaceVector(480, 640)
+    controllers = {
+        "discrete": lambda: DiscreteController(FaceTracker.LR_S, FaceTracker.UD_S, FaceTracker.FB_S,
+                                               FaceTracker.CW_S),
+        "pid": lambda: PIDController(fv.width, fv.height, fv.target_square_ratio, FaceTracker.LR_S,
+                                     FaceTracker.UD_S, FaceTracker.FB_S, FaceTracker.CW_S)}
+    starts = [(200, 0, 0.05), (-150, 100, 0.03), (0, -150, 0.08), (250, 150, 0.02)]
+    print(f"{'controller':>10} {'settled':>8} {'mean ttc s':>10} {'mean overshoot':>14} {'max overshoot':>13}")
+    for name, make in controllers.items():
+        metrics = SettleMetrics(fv.width * fv.target_face_region_ratio, fv.height * fv.target_face_region_ratio)
+        unsettled = 0
+        for start in starts:
+            run = simulate(make(), fv, start, fps=FaceTracker.FPS)
+            metrics.episodes += run.episodes
+            unsettled += run.summary()["unsettled"]
+        s = metrics.summary()
+        ttc = f"{s['mean_time_to_centre']:.2f}" if s['mean_time_to_centre'] is not None else "-"
+        mean_overshoot = f"{s['mean_overshoot']:.2f}" if s['mean_overshoot'] is not None else "-"
+        max_overshoot = f"{s['max_overshoot']:.2f}" if s['max_overshoot'] is not None else "-"
+        print(f"{name:>10} {f'{len(starts) - unsettled}/{len(starts)}':>8} {ttc:>10} {mean_overshoot:>14} "
+              f"{max_overshoot:>13}")
+
+
+if __name__ == "__main__":
+    main()
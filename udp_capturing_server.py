@@ -1,15 +1,86 @@
 import cv2
+from video_ingest import create_ingest
+from threading import Thread, Condition
+from time import time, sleep
+
+
+class BackgroundFrameRead:
+    """Keeps draining the video capture in a background thread and publishes only the newest frame,
+    so slow consumers never work with frames stuck in the FFmpeg UDP buffer"""
+
+    """Constants"""
+    RETRY_DELAY = 0.01  # pause after unsuccessful reading
+
+    def __init__(self, server):
+        self.server = server
+        self.condition = Condition()
+        self.frame = None
+        self.seq = 0
+        self.timestamp = None
+        self.frames_read = 0
+        self.read_errors = 0
+        self.stopped = False
+        self.worker = Thread(target=self.update_frame, daemon=True)
+
+    def start(self):
+        self.worker.start()
+        return self
+
+    def update_frame(self):
+        while not self.stopped:
+            try:
+                r, frame = self.server.get_video_capture().read()
+            except (ValueError, cv2.error):
+                r, frame = False, None
+            if not r or frame is None:
+                self.read_errors += 1
+                sleep(self.RETRY_DELAY)
+                continue
+            timestamp = time()
+            with self.condition:
+                self.frame = frame
+                self.seq += 1
+                self.timestamp = timestamp
+                self.frames_read += 1
+                self.condition.notify_all()
+
+    def latest_frame(self):
+        """Non-blocking. Returns: (seq, capture timestamp, frame) of the newest frame or None if there is no frame yet"""
+        with self.condition:
+            if self.frame is None:
+                return None
+            return self.seq, self.timestamp, self.frame
+
+    def wait_for_newer(self, seq, timeout=None):
+        """Waits for a frame newer than seq.
+        Returns: (seq, capture timestamp, frame) or None on timeout"""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.seq > seq or self.stopped, timeout):
+                return None
+            if self.frame is None or self.seq <= seq:
+                return None
+            return self.seq, self.timestamp, self.frame
+
+    def stop(self):
+        self.stopped = True
+        with self.condition:
+            self.condition.notify_all()
+        if self.worker.is_alive():
+            self.worker.join(1)
 
 
 class UDPCapturingServer:
-    def __init__(self, address=('0.0.0.0', 11111)):
+    def __init__(self, address=('0.0.0.0', 11111), client="192.168.10.1", backend="opencv"):
+        """Arguments: address: local address to receive video at, client: drone address,
+        backend: video ingest backend, "opencv" (cv2.VideoCapture) or "nal" (own socket and PyAV decoder)"""
 
         self.clients = []
-        self.add_client("192.168.10.1")
+        self.add_client(client)
 
         self.host = address[0]
         self.port = address[1]
         self.address = address
+        self.backend = backend
 
         self.cap = None
         self.frame = None
@@ -34,18 +105,35 @@ class UDPCapturingServer:
     def add_client(self, client):
         self.clients.append(client)
 
-    def get_udp_video_address(self):
-        return 'udp://@' + self.host + ':' + str(self.port)  # + '?overrun_nonfatal=1&fifo_size=5000'
-
     def get_video_capture(self):
+        """Returns: the video ingest (cv2.VideoCapture-like read(), isOpened(), release() and stats)"""
         if self.cap is None:
-            self.cap = cv2.VideoCapture(self.get_udp_video_address())
+            self.cap = create_ingest(self.backend, self.address)
 
         if not self.cap.isOpened():
-            self.cap.open(self.get_udp_video_address())
+            self.cap.open()
 
         return self.cap
 
+    def start_background_read(self):
+        """Starts background frame reading. Returns: BackgroundFrameRead"""
+        if self.background_frame_read is None:
+            self.background_frame_read = BackgroundFrameRead(self).start()
+        return self.background_frame_read
+
+    def latest_frame(self):
+        """Returns: (seq, capture timestamp, frame) of the newest frame or None"""
+        return self.start_background_read().latest_frame()
+
+    def wait_for_newer(self, seq, timeout=None):
+        """Returns: (seq, capture timestamp, frame) of a frame newer than seq or None on timeout"""
+        return self.start_background_read().wait_for_newer(seq, timeout)
+
+    def stop_background_read(self):
+        if self.background_frame_read is not None:
+            self.background_frame_read.stop()
+            self.background_frame_read = None
+
 
 def main():
     from udp_client import UDPClient
@@ -53,18 +141,15 @@ def main():
     print(client.send_message_with_response("command"))
     print(client.send_message_with_response("streamon"))
     server = UDPCapturingServer()
-    res = False
-    frame = None
+    server.start_background_read()
+    seq = 0
     cv2.namedWindow("drone")
     while True:
-        try:
-            cap = server.get_video_capture()
-            res, frame = cap.read()
-        except ValueError:
-            pass
-        if res and frame is not None:
+        latest = server.latest_frame()
+        if latest is not None and latest[0] > seq:
+            seq, timestamp, frame = latest
             cv2.imshow("drone", frame)
-            print(f"Frame is: {frame}")
+            print(f"Frame {seq} is {time() - timestamp:.3f} s old")
             print(f"Shape is: {frame.shape}")
         key = cv2.waitKey(5) & 0xff
         if key == ord('q'):
@@ -1,29 +1,39 @@
 import socket
+from metrics import METRICS
 
 
 class UDPClient:
-    def __init__(self, server=("192.168.10.1", 8889), buffer_size=1024):
+    def __init__(self, server=("192.168.10.1", 8889), buffer_size=1024, timeout=None):
+        """Arguments: timeout: seconds to wait for a response, socket.timeout is raised after it (no limit by default)"""
         self.server = server
         self.buffer_size = buffer_size
         self.udp_client_socket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+        self.udp_client_socket.settimeout(timeout)
 
     def receive_message(self):
-        response = self.udp_client_socket.recvfrom(self.buffer_size)
+        with METRICS.timer("udp_receive"):
+            response = self.udp_client_socket.recvfrom(self.buffer_size)
+        METRICS.inc("udp_received")
         try:
             decoded_response = response[0].decode('utf-8').rstrip("\r\n")
             return decoded_response
         except UnicodeDecodeError:
+            METRICS.inc("udp_decode_errors")
             print(UnicodeDecodeError, "не удалось расшифровать ответ сервера")
 
     def send_message(self, message):
         encoded_message = str.encode(message)
-        self.udp_client_socket.sendto(encoded_message, self.server)
+        with METRICS.timer("udp_send"):
+            self.udp_client_socket.sendto(encoded_message, self.server)
+        METRICS.inc("udp_sent")
 
     def send_message_with_response(self, message):
-        encoded_message = str.encode(message)
-        self.udp_client_socket.sendto(encoded_message, self.server)
+        self.send_message(message)
         return self.receive_message()
 
+    def close(self):
+        self.udp_client_socket.close()
+
 
 def main():
     import time
@@ -0,0 +1,249 @@
+import os
+import socket
+from collections import deque
+from time import perf_counter
+import cv2
+import numpy as np
+
+
+class IngestStats:
+    """Per-frame decode latency, buffer depth and corrupted/dropped frame counters of a video ingest backend"""
+
+    """Constants"""
+    WINDOW = 300  # latencies kept for percentiles
+
+    def __init__(self):
+        self.frames = 0
+        self.corrupted = 0
+        self.dropped = 0
+        self.read_errors = 0
+        self.latencies = deque(maxlen=self.WINDOW)
+        self.buffer_depth = None
+        self.max_buffer_depth = 0
+
+    def add_latency(self, latency):
+        self.frames += 1
+        self.latencies.append(latency)
+
+    def set_buffer_depth(self, depth):
+        self.buffer_depth = depth
+        if depth is not None:
+            self.max_buffer_depth = max(self.max_buffer_depth, depth)
+
+    def summary(self):
+        latencies = np.asarray(self.latencies) * 1000
+        p50, p95 = np.percentile(latencies, [50, 95]) if len(latencies) else (None, None)
+        return {"frames": self.frames,
+                "decode_p50_ms": float(p50) if p50 is not None else None,
+                "decode_p95_ms": float(p95) if p95 is not None else None,
+                "buffer_depth": self.buffer_depth,
+                "max_buffer_depth": self.max_buffer_depth,
+                "corrupted": self.corrupted,
+                "dropped": self.dropped,
+                "read_errors": self.read_errors}
+
+
+class OpenCVIngest:
+    """cv2.VideoCapture over FFmpeg's UDP input with low latency options: no input buffering,
+    low delay decoding, overrun of the UDP FIFO is not fatal. Decode latency is the time of read()
+    after the first frame, buffer depth is not visible through OpenCV"""
+
+    """Constants"""
+    CAPTURE_OPTIONS = "fflags;nobuffer|flags;low_delay|framedrop;1"
+    FIFO_SIZE = 5000  # FFmpeg UDP FIFO, in 188 byte packets
+
+    def __init__(self, address):
+        self.address = address
+        self.cap = None
+        self.stats = IngestStats()
+
+    def url(self):
+        return f"udp://@{self.address[0]}:{self.address[1]}?overrun_nonfatal=1&fifo_size={self.FIFO_SIZE}"
+
+    def open(self):
+        # Options are read by OpenCV when the capture is opened, a value set by the user wins
+        os.environ.setdefault("OPENCV_FFMPEG_CAPTURE_OPTIONS", self.CAPTURE_OPTIONS)
+        if self.cap is None:
+            self.cap = cv2.VideoCapture(self.url(), cv2.CAP_FFMPEG)
+        elif not self.cap.isOpened():
+            self.cap.open(self.url(), cv2.CAP_FFMPEG)
+        return self.cap.isOpened()
+
+    def isOpened(self):
+        return self.cap is not None and self.cap.isOpened()
+
+    def read(self):
+        start = perf_counter()
+        r, frame = self.cap.read()
+        if not r or frame is None:
+            self.stats.read_errors += 1
+            return False, None
+        self.stats.add_latency(perf_counter() - start)
+        return True, frame
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+
+
+class NALIngest:
+    """Receives the H.264 UDP packets on its own socket, reassembles access units and decodes every one
+    as soon as it is complete with PyAV (requires PyAV: pip install av), without any container or FIFO buffering.
+    An access unit is complete on a packet shorter than PACKET_SIZE (the drone splits frames into 1460 byte packets)
+    or when the next one starts. Decode latency is measured from the last packet of the access unit,
+    buffer depth is the number of bytes waiting in the socket receive buffer"""
+
+    """Constants"""
+    PACKET_SIZE = 1460
+    BUFFER_SIZE = 2048
+    RECEIVE_BUFFER = 1024 * 1024
+    TIMEOUT = 1.0
+
+    def __init__(self, address):
+        try:
+            import av
+        except ImportError:
+            raise ImportError("NALIngest requires PyAV: pip install av")
+        self.av = av
+        self.address = address
+        self.socket = None
+        self.codec = None
+        self.buffer = bytearray(self.BUFFER_SIZE)
+        self.view = memoryview(self.buffer)
+        self.access_unit = bytearray()
+        self.has_slice = False
+        self.stats = IngestStats()
+
+    def open(self):
+        if self.socket is None:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.RECEIVE_BUFFER)
+            self.socket.bind(self.address)
+            self.socket.settimeout(self.TIMEOUT)
+        self.codec = self.av.CodecContext.create("h264", "r")
+        self.codec.flags |= self.av.codec.context.Flags.low_delay
+        self.codec.thread_type = "SLICE"  # frame threading holds frames back
+        return True
+
+    def isOpened(self):
+        return self.socket is not None
+
+    @staticmethod
+    def scan(packet):
+        """Returns: (the packet starts a new access unit, the packet has a slice)"""
+        starts, has_slice = False, False
+        i = packet.find(b'\x00\x00\x01')
+        while 0 <= i < len(packet) - 4:
+            nal_type = packet[i + 3] & 0x1f
+            if nal_type in (1, 5):
+                has_slice = True
+                if packet[i + 4] & 0x80:  # first_mb_in_slice == 0
+                    starts = True
+            elif nal_type in (7, 8, 9):
+                starts = True
+            i = packet.find(b'\x00\x00\x01', i + 4)
+        return starts, has_slice
+
+    def read(self):
+        """Returns: (True, BGR frame) or (False, None) on timeout"""
+        while self.socket is not None:
+            try:
+                size = self.socket.recv_into(self.buffer)
+            except socket.timeout:
+                self.stats.read_errors += 1
+                return False, None
+            except OSError:
+                return False, None
+            frame = self.feed(bytes(self.view[:size]), perf_counter())
+            if frame is not None:
+                self.stats.set_buffer_depth(self.pending_bytes())
+                return True, frame
+        return False, None
+
+    def feed(self, packet, arrived):
+        """Adds a UDP packet received at ARRIVED (perf_counter()).
+        Returns: BGR frame if the packet completed an access unit, None otherwise"""
+        starts, has_slice = self.scan(packet)
+        frame = None
+        if starts and self.has_slice:
+            frame = self.decode(arrived)
+        self.access_unit += packet
+        self.has_slice = self.has_slice or has_slice
+        if len(packet) < self.PACKET_SIZE and self.has_slice:
+            decoded = self.decode(arrived)
+            frame = decoded if decoded is not None else frame
+        return frame
+
+    def decode(self, arrived):
+        data, self.access_unit, self.has_slice = bytes(self.access_unit), bytearray(), False
+        try:
+            frames = self.codec.decode(self.av.Packet(data))
+        except self.av.error.FFmpegError:
+            self.stats.corrupted += 1
+            return None
+        if not frames:
+            self.stats.dropped += 1
+            return None
+        self.stats.dropped += len(frames) - 1
+        frame = frames[-1].to_ndarray(format="bgr24")
+        if frames[-1].is_corrupt:
+            self.stats.corrupted += 1
+        self.stats.add_latency(perf_counter() - arrived)
+        return frame
+
+    def pending_bytes(self):
+        try:
+            import fcntl
+            import termios
+            import struct
+            return struct.unpack("i", fcntl.ioctl(self.socket, termios.FIONREAD, b"\0\0\0\0"))[0]
+        except (ImportError, OSError):  # Windows
+            return None
+
+    def release(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+
+BACKENDS = {"opencv": OpenCVIngest, "nal": NALIngest}
+
+
+def create_ingest(backend, address):
+    """Arguments: backend: "opencv" or "nal", address: local address to receive video at"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown video backend {backend}, known: {', '.join(BACKENDS)}")
+    return BACKENDS[backend](address)
+
+
+def main():
+    """Compares the backends on the local simulator: glass-to-glass latency from the frame markers and ingest stats"""
+    import sys
+    from tello_simulator import TelloSimulator, SyntheticH264Source, read_frame_marker, percentiles
+    from udp_capturing_server import UDPCapturingServer
+    backends = sys.argv[1:] or list(BACKENDS)
+    for backend in backends:
+        with TelloSimulator(video_source=SyntheticH264Source(), stream_on=True) as sim:
+            server = UDPCapturingServer(('0.0.0.0', 11111), "127.0.0.1", backend)
+            server.start_background_read()
+            glass_to_glass = []
+            seq = 0
+            deadline = perf_counter() + 10
+            while perf_counter() < deadline and len(glass_to_glass) < 200:
+                latest = server.wait_for_newer(seq, 1)
+                if latest is None:
+                    continue
+                seq, timestamp, frame = latest
+                sent = sim.frame_send_times.get(read_frame_marker(frame))
+                if sent is not None and 0 <= timestamp - sent < 5:
+                    glass_to_glass.append(timestamp - sent)
+            server.stop_background_read()
+            stats = server.get_video_capture().stats.summary()
+            server.get_video_capture().release()
+            print(f"{backend}: glass-to-glass {percentiles(glass_to_glass)}")
+            print(f"{backend}: {stats}, sent {sim.sent_frames} frames")
+
+
+if __name__ == "__main__":
+    main()